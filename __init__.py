@@ -1,9 +1,43 @@
-import sys
-EXPECTED_RECURSION: int = 20000
-CURRENT_RECURSION: int = sys.getrecursionlimit()
-print(f"Current recursion limit = {CURRENT_RECURSION}.")
-if EXPECTED_RECURSION > CURRENT_RECURSION:
-    print(f"Setting recursion limit to {EXPECTED_RECURSION}.")
-    sys.setrecursionlimit(EXPECTED_RECURSION)
+"""
+Importing the package imports nothing else, the modules and their main classes load on first access:
 
+    from shared import Workhorse
+    import shared; shared.lok.Lok
+"""
+import importlib
 
+# builtin generics, typing alone takes longer to import than the rest of this module
+SUBMODULES: list[str] = ["js3", "js3dec", "lok", "otimer", "workhorse", "workhorse_remote", "workhorse_telemetry"]
+# name -> module that defines it
+ATTRIBUTES: dict[str, str] = {
+    "JS3": "js3",
+    "JS3Enc": "js3",
+    "JS3Dec": "js3dec",
+    "Lok": "lok",
+    "LokLevel": "lok",
+    "LokFileSink": "lok",
+    "OTimer": "otimer",
+    "OSpans": "otimer",
+    "Workhorse": "workhorse",
+    "Workload": "workhorse",
+    "WorkhorseBackend": "workhorse",
+    "WorkhorseTransport": "workhorse",
+    "WorkerDaemon": "workhorse_remote",
+    "JobReport": "workhorse_telemetry",
+}
+__all__ = SUBMODULES + list(ATTRIBUTES)
+
+
+def __getattr__(name: str) -> object:
+    if name in SUBMODULES:
+        # importing a submodule sets it on the package, __getattr__ is not asked again
+        return importlib.import_module(f"{__name__}.{name}")
+    if name in ATTRIBUTES:
+        value: object = getattr(importlib.import_module(f"{__name__}.{ATTRIBUTES[name]}"), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
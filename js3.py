@@ -2,18 +2,30 @@ from __future__ import annotations
 
 import datetime
 import json
+import sys
 from datetime import date
 from enum import Enum
 from json import JSONEncoder
 from pathlib import Path
 from typing import List, Dict, Set, TypeVar, Optional, Type, Any, Tuple
 
+from shared.otimer import OSpans
+
 
 class JS3:
     ignored: Set[str] = set()
 
 
 SKIP: Set[str] = {'__objclass__', '_sort_order_'}
+# encoding and decoding recurse once per level of nesting
+RECURSION_LIMIT: int = 20000
+
+
+def ensure_recursion_limit():
+    """raises the process-wide recursion limit to RECURSION_LIMIT, never lowers it"""
+    if sys.getrecursionlimit() < RECURSION_LIMIT:
+        sys.setrecursionlimit(RECURSION_LIMIT)
+
 
 # Define the type variable T
 T = TypeVar('T', str, int, bool, float, List, Dict, Set, Enum, date, JS3)
@@ -75,6 +87,9 @@ class DictWrap(Wrap):
             ks: List[Any] = []
             vs: List[Any] = []
             d: [str, str | Any] = {"__ci": "DW", "ks": ks, "vs": vs}
+            if self.o.ref_counter > 1:
+                # later references to this dict point here
+                d['__id'] = self.o.index
             for k, v in self.d.items():
                 ks.append(k)
                 vs.append(v)
@@ -337,18 +352,24 @@ class JS3Enc:
         self.traversal: Optional[Traversal] = None
 
     def __encode(self) -> Any:
-        self.traversal = Traversal()
-        self.root = self.traversal.create_o(self.ins)
-        self.root.traverse(traversal=self.traversal)
-        x = self.root.full()
+        ensure_recursion_limit()
+        with OSpans.span("JS3Enc.traverse"):
+            self.traversal = Traversal()
+            self.root = self.traversal.create_o(self.ins)
+            self.root.traverse(traversal=self.traversal)
+        with OSpans.span("JS3Enc.full"):
+            x = self.root.full()
         return x
 
     def encode(self, indent: int = 2) -> str:
-        x = self.__encode()
-        js: str = json.dumps(x, indent=indent, cls=LeEncoder)
+        with OSpans.span("JS3Enc.encode"):
+            x = self.__encode()
+            with OSpans.span("JS3Enc.dump"):
+                js: str = json.dumps(x, indent=indent, cls=LeEncoder)
         return js
 
     def save(self, file: Path, indent: Optional[int] = None):
-        x = self.__encode()
-        with open(file, "w") as f:
-            json.dump(x, f, indent=indent, cls=LeEncoder)
+        with OSpans.span("JS3Enc.save"):
+            x = self.__encode()
+            with OSpans.span("JS3Enc.dump"), open(file, "w") as f:
+                json.dump(x, f, indent=indent, cls=LeEncoder)
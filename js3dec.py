@@ -4,12 +4,14 @@ import sys
 
 import datetime
 import importlib
-import inspect
 import json
 from enum import Enum
 from pathlib import Path
 from typing import Optional, Any, Dict, List, Type, Set
 
+from shared.js3 import ensure_recursion_limit
+from shared.otimer import OSpans
+
 SKIP: Set[str] = {'__id', '__ci', '__r'}
 T_SIMPLE: Set[Type] = {str, bool, int, float}
 
@@ -49,8 +51,12 @@ class JS3Dec:
         return self
 
     def decode(self) -> Any:
-        self.__read_src()
-        return self.decode_instance(self.dicts)
+        ensure_recursion_limit()
+        with OSpans.span("JS3Dec.decode"):
+            with OSpans.span("JS3Dec.parse"):
+                self.__read_src()
+            with OSpans.span("JS3Dec.instantiate"):
+                return self.decode_instance(self.dicts)
 
     def instance(self, cls: Type) -> Any:
         """
@@ -73,6 +79,7 @@ class JS3Dec:
                         # This should have been caught by the initial cls() call, but handle it just in case.
                         return cls()
 
+                    import inspect
                     signature = inspect.signature(init_method)
 
                     # Get the constructor arguments (excluding 'self')
@@ -3,11 +3,31 @@ from __future__ import annotations
 import sys
 from datetime import datetime
 
-import multiprocessing
-import traceback
+import atexit
+import json
+import os
+import queue
+import threading
+import time
 
+from collections import deque
 from enum import Enum
-from typing import TextIO, Any, Optional, List
+from pathlib import Path
+from typing import TextIO, Any, Optional, List, Tuple, Deque
+
+
+class LokLevel(Enum):
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+
+
+# LokLevel.value is a descriptor lookup, the level checks compare against these plain ints
+_DEBUG: int = LokLevel.DEBUG.value
+_INFO: int = LokLevel.INFO.value
+_WARNING: int = LokLevel.WARNING.value
+_ERROR: int = LokLevel.ERROR.value
 
 
 class LokOutType(Enum):
@@ -28,19 +48,293 @@ class LokOutType(Enum):
             return sys.stderr
 
 
+# (time.time(), logger name, process name, LokLevel.value, message, LokOutType.value)
+LokRecord = Tuple[float, str, str, int, str, str]
+
+
+class LokFileSink:
+    """
+    Writes every emitted Lok line as one JSON record per line to <directory>/<prefix>.<pid>.jsonl. Every process has
+    a file of its own, so any number of Workhorse processes can share the directory without locking. Records are
+    buffered and written once flush_bytes piled up or flush_interval seconds passed. A file growing beyond max_bytes
+    is renamed to <prefix>.<pid>.<time_ns>.jsonl and, with compress, gzipped on a background thread.
+    """
+    # held while a sink (re)starts in a process, self.lock may have been copied held by fork
+    opening: threading.Lock = threading.Lock()
+
+    def __init__(self, directory: Path, prefix: str = "lok", max_bytes: int = 10 * 1024 * 1024,
+                 flush_bytes: int = 64 * 1024, flush_interval: float = 1.0, compress: bool = True):
+        self.directory: Path = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prefix: str = prefix
+        self.max_bytes: int = max_bytes
+        self.flush_bytes: int = flush_bytes
+        self.flush_interval: float = flush_interval
+        self.compress: bool = compress
+        self.pid: int = -1
+        self.lock: threading.Lock = threading.Lock()
+        self.buffer: List[str] = []
+        self.buffered: int = 0
+        self.file: Optional[Any] = None
+        self.written: int = 0
+        self.closed: threading.Event = threading.Event()
+        self.compressors: List[threading.Thread] = []
+
+    def path(self) -> Path:
+        return Path(self.directory, f"{self.prefix}.{self.pid}.jsonl")
+
+    def __open(self):
+        """(Re)starts in a new process, what a parent had buffered is the parent's business. Call with opening held."""
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.buffered = 0
+        self.file = None
+        self.compressors = []
+        self.closed = threading.Event()
+        threading.Thread(target=self.__flush_periodically, name="LokFileSink", daemon=True).start()
+        # process pool workers leave through os._exit(), which skips atexit but runs these
+        import multiprocessing.util
+        multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+        # last, other threads use the sink once they see it
+        self.pid = os.getpid()
+
+    @staticmethod
+    def _after_fork():
+        LokFileSink.opening = threading.Lock()
+
+    def write(self, t: float, name: str, process_info: str, level: int, message: str):
+        if self.pid != os.getpid():
+            with LokFileSink.opening:
+                if self.pid != os.getpid():
+                    self.__open()
+        line: str = json.dumps({"timestamp": t, "logger": name, "process": process_info, "pid": self.pid,
+                                "level": LokLevel(level).name, "message": message}) + "\n"
+        with self.lock:
+            self.buffer.append(line)
+            self.buffered += len(line)
+            if self.buffered >= self.flush_bytes:
+                self.__flush()
+
+    def flush(self):
+        if self.pid != os.getpid():
+            return
+        with self.lock:
+            self.__flush()
+
+    def __flush(self):
+        if len(self.buffer) == 0:
+            return
+        if self.file is None:
+            self.file = open(self.path(), "a", encoding="utf-8")
+            self.written = self.file.tell()
+        data: str = "".join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        self.file.write(data)
+        self.file.flush()
+        self.written += len(data)
+        if self.written >= self.max_bytes:
+            self.__rotate()
+
+    def __rotate(self):
+        self.file.close()
+        self.file = None
+        rotated: Path = Path(self.directory, f"{self.prefix}.{self.pid}.{time.time_ns()}.jsonl")
+        os.replace(self.path(), rotated)
+        if self.compress:
+            t = threading.Thread(target=LokFileSink.gzip, args=(rotated,), name="LokFileSink gzip")
+            t.start()
+            self.compressors = [c for c in self.compressors if c.is_alive()] + [t]
+
+    @staticmethod
+    def gzip(src: Path):
+        import gzip
+        import shutil
+        tmp: Path = Path(f"{src}.gz.tmp")
+        with open(src, "rb") as f_in, gzip.open(tmp, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.replace(tmp, Path(f"{src}.gz"))
+        src.unlink()
+
+    def __flush_periodically(self):
+        closed: threading.Event = self.closed
+        while not closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        if self.pid != os.getpid():
+            return
+        self.closed.set()
+        with self.lock:
+            self.__flush()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        for t in self.compressors:
+            t.join()
+
+
+class LokWriter:
+    """Formats queued LokRecords on a background thread and writes them in batches, one write and flush per batch."""
+    MAX_BATCH: int = 1024
+
+    def __init__(self, records: Any):
+        self.records: Any = records
+        self.thread: threading.Thread = threading.Thread(target=self.run, name="LokWriter", daemon=True)
+        self.last_second: int = -1
+        self.last_timestamp: str = ""
+
+    def start(self) -> LokWriter:
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Writes everything queued so far and ends the thread."""
+        self.records.put(None)
+        self.thread.join()
+
+    def run(self):
+        while True:
+            batch: List[Optional[LokRecord]] = [self.records.get()]
+            try:
+                while len(batch) < self.MAX_BATCH:
+                    batch.append(self.records.get_nowait())
+            except queue.Empty:
+                pass
+            if not self.write(batch):
+                return
+
+    def timestamp(self, t: float) -> str:
+        second: int = int(t)
+        if second != self.last_second:
+            self.last_second = second
+            self.last_timestamp = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+        return self.last_timestamp
+
+    def write(self, batch: List[Optional[LokRecord]]) -> bool:
+        """Returns False once the stop marker shows up."""
+        go_on: bool = True
+        std: List[str] = []
+        err: List[str] = []
+        for record in batch:
+            if record is None:
+                go_on = False
+                continue
+            t, name, process_info, level, message, out = record
+            for sink in Lok.sinks:
+                sink.write(t, name, process_info, level, message)
+            if not Lok.console:
+                continue
+            lines: List[str] = std if out == LokOutType.STD.value else err
+            timestamp: str = self.timestamp(t)
+            for s_line in message.split("\n"):
+                lines.append(f"[{name}] [{process_info}], {timestamp}: {s_line}\n")
+        for lines, out in [(std, sys.stdout), (err, sys.stderr)]:
+            if len(lines) > 0:
+                out.write("".join(lines))
+                out.flush()
+        return go_on
+
+
 class Lok:
+    # when set, every emitted line is a single put of a LokRecord, see start_writer() and start_listener()
+    records: Optional[Any] = None
+    writer: Optional[LokWriter] = None
+    # the writer reads from a multiprocessing queue that other processes attach() to
+    shared: bool = False
+    _process_name: Optional[str] = None
+    # every emitted line goes to these as well, see add_sink()
+    sinks: List[LokFileSink] = []
+    # set to False to only write to the sinks
+    console: bool = True
+
+    @staticmethod
+    def add_sink(sink: LokFileSink):
+        Lok.sinks = Lok.sinks + [sink]
+
+    @staticmethod
+    def remove_sink(sink: LokFileSink):
+        Lok.sinks = [s for s in Lok.sinks if s is not sink]
+        sink.close()
+
+    @staticmethod
+    def close_sinks():
+        for sink in Lok.sinks:
+            sink.close()
+
     @staticmethod
     def from_instance(ins: Any) -> Lok:
         return Lok(name=ins.__class__.__qualname__)
 
-    def __init__(self, name: Optional[str] = None, src: Optional[Any] = None, out: TextIO = sys.stdout):
+    @staticmethod
+    def process_name() -> str:
+        if Lok._process_name is None:
+            import multiprocessing
+            Lok._process_name = multiprocessing.current_process().name
+        return Lok._process_name
+
+    @staticmethod
+    def start_writer():
+        """Lines of this process are queued and written by a background thread instead of printed one by one."""
+        Lok.stop_writer()
+        Lok.records = queue.SimpleQueue()
+        Lok.shared = False
+        Lok.writer = LokWriter(Lok.records).start()
+
+    @staticmethod
+    def start_listener() -> Any:
+        """
+        Like start_writer() but other processes can attach() to the returned multiprocessing queue, so their lines
+        are written by this process. Workhorse attaches its worker processes.
+        """
+        import multiprocessing
+        Lok.stop_writer()
+        Lok.records = multiprocessing.Queue()
+        Lok.shared = True
+        Lok.writer = LokWriter(Lok.records).start()
+        return Lok.records
+
+    @staticmethod
+    def attach(records: Any):
+        """Sends the lines of this process to the listener owning records, see start_listener()."""
+        Lok.records = records
+        Lok.shared = records is not None
+        Lok._process_name = None
+
+    @staticmethod
+    def stop_writer():
+        """Writes what is still queued and goes back to printing right away."""
+        writer: Optional[LokWriter] = Lok.writer
+        Lok.records = None
+        Lok.writer = None
+        Lok.shared = False
+        if writer is not None:
+            writer.stop()
+
+    @staticmethod
+    def _after_fork():
+        Lok._process_name = None
+        # the writer belongs to the parent
+        Lok.writer = None
+        if not Lok.shared:
+            # the writer thread did not survive the fork, a multiprocessing queue does
+            Lok.records = None
+
+    def __init__(self, name: Optional[str] = None, src: Optional[Any] = None, out: TextIO = sys.stdout,
+                 level: LokLevel = LokLevel.INFO, capacity: int = 1000):
         self.name: str = src.__class__.__qualname__ if name is None else name
         assert self.name is not None
         self.out: LokOutType = LokOutType.by_text_io(out)
         self.enabled: bool = True
-        self.stored_lines: List[str] = []
+        # LokLevel.value below which calls return right away
+        self.threshold: int = level.value
+        # what a disabled Lok would have printed as (time, process, message), the oldest records are dropped once it
+        # is full
+        self.stored: Deque[Tuple[float, str, str]] = deque(maxlen=capacity)
 
     def __call__(self, obj: any, file: Optional[TextIO | LokOutType] = None):
+        if _INFO < self.threshold:
+            return
         out: LokOutType = self.out
         if file is not None:
             if isinstance(file, LokOutType):
@@ -53,30 +347,89 @@ class Lok:
         self.enabled = enabled
         return self
 
-    def __print_any(self, obj: any, out: TextIO, override_enabled: bool = False):
-        process_info = multiprocessing.current_process().name
+    def set_level(self, level: LokLevel) -> Lok:
+        self.threshold = level.value
+        return self
+
+    def is_enabled_for(self, level: LokLevel) -> bool:
+        return level.value >= self.threshold
+
+    def debug(self, obj: any, *args: Any):
+        """
+        Like all level methods nothing is formatted if the level is suppressed. obj may be a callable producing the
+        message, only for the level methods, or a %-style format for args.
+        """
+        if _DEBUG < self.threshold:
+            return
+        self.__print_any(obj, out=self.out.out(), args=args, level=LokLevel.DEBUG, lazy=True)
+
+    def info(self, obj: any, *args: Any):
+        if _INFO < self.threshold:
+            return
+        self.__print_any(obj, out=self.out.out(), args=args, level=LokLevel.INFO, lazy=True)
+
+    def warning(self, obj: any, *args: Any):
+        if _WARNING < self.threshold:
+            return
+        self.__print_any(obj, out=self.out.out(), args=args, level=LokLevel.WARNING, lazy=True)
+
+    def error(self, obj: any, *args: Any):
+        if _ERROR < self.threshold:
+            return
+        self.__print_any(obj, out=sys.stderr, args=args, level=LokLevel.ERROR, lazy=True)
+
+    @staticmethod
+    def message(obj: any, args: Tuple, lazy: bool = False) -> str:
+        if lazy and callable(obj) and not isinstance(obj, type):
+            obj = obj()
+        if len(args) > 0:
+            return obj % args
+        return obj if type(obj) is str else f"{obj}"
+
+    def __print_any(self, obj: any, out: TextIO, override_enabled: bool = False, args: Tuple = (),
+                    level: LokLevel = LokLevel.INFO, lazy: bool = False):
+        message: str = Lok.message(obj, args, lazy)
+        if not (self.enabled or override_enabled):
+            # rendered now, obj may change or be anything that keeps the Lok from pickling
+            self.stored.append((time.time(), Lok.process_name(), message))
+            return
+        records: Optional[Any] = Lok.records
+        if records is not None and (out is sys.stdout or out is sys.stderr):
+            records.put((time.time(), self.name, Lok.process_name(), level.value, message,
+                         LokOutType.STD.value if out is sys.stdout else LokOutType.ERR.value))
+            return
+        if len(Lok.sinks) > 0:
+            t: float = time.time()
+            for sink in Lok.sinks:
+                sink.write(t, self.name, Lok.process_name(), level.value, message)
+        if not Lok.console:
+            return
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        s: str = f"{obj}"
-        s_lines: List[str] = s.split("\n")
-        for s_line in s_lines:
-            line: str = f"[{self.name}] [{process_info}], {timestamp}: {s_line}"
-            self.__print_line(line, out=out, override_enabled=override_enabled)
-
-    def __print_line(self, line: str, out: TextIO, override_enabled: bool = False):
-        if self.enabled or override_enabled:
+        for line in self.__lines(timestamp, Lok.process_name(), message):
             print(line, file=out)
-        else:
-            self.stored_lines.append(line)
+
+    def __lines(self, timestamp: str, process_info: str, s: str) -> List[str]:
+        return [f"[{self.name}] [{process_info}], {timestamp}: {s_line}" for s_line in s.split("\n")]
+
+    @property
+    def stored_lines(self) -> List[str]:
+        lines: List[str] = []
+        for t, process_info, message in self.stored:
+            timestamp: str = datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S")
+            lines.extend(self.__lines(timestamp, process_info, message))
+        return lines
 
     def print(self, obj: any, out: Optional[TextIO] = None):
+        if _INFO < self.threshold:
+            return
         out = self.out.out() if out is None else out
         self.__print_any(obj=obj, out=out)
 
     def err(self, obj: any):
-        self.__print_any(obj=obj, out=sys.stderr, override_enabled=True)
+        self.__print_any(obj=obj, out=sys.stderr, override_enabled=True, level=LokLevel.ERROR)
 
     def print_self(self) -> Lok:
-        if len(self.stored_lines) == 0:
+        if len(self.stored) == 0:
             return self
         print(f"Lok '{self.name}'")
         for l in self.stored_lines:
@@ -86,7 +439,14 @@ class Lok:
     def exception(self, e):
         lines: List[str] = [f"Exception '{e.__class__.__qualname__}'."]
         if e.__traceback__ is not None:
+            import traceback
             tb = traceback.extract_tb(e.__traceback__)
             lines.extend(traceback.format_list(tb))
         for l in lines:
             self.err(l)
+
+os.register_at_fork(after_in_child=Lok._after_fork)
+os.register_at_fork(after_in_child=LokFileSink._after_fork)
+# atexit runs the last registered first, the writer still feeds the sinks
+atexit.register(Lok.close_sinks)
+atexit.register(Lok.stop_writer)
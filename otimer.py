@@ -1,33 +1,144 @@
+from __future__ import annotations
+
+import functools
+import math
+import os
+import threading
 import time
 
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Callable, Any, Tuple, Deque, Iterator
+
+# saves the attribute lookup on time for every start() and stop()
+_now = time.perf_counter_ns
+# the histogram layout, shared by OTimer.bucket() and the copy of it inlined in OTimer.stop()
+_SUB_BUCKET_BITS: int = 4
+# durations below get a bucket each
+_LINEAR_BUCKETS: int = 2 << _SUB_BUCKET_BITS
+# a longer duration is shifted right by its bit_length() minus this
+_SHIFT_OFFSET: int = _SUB_BUCKET_BITS + 1
+
 
 class OTimer:
+    """
+    Sums up and distributes the time between start() and stop(), in nanoseconds from time.perf_counter_ns().
+    Durations go into a log-bucketed histogram (16 buckets per power of two, so a percentile is off by at most 1/16),
+    which keeps the memory constant no matter how often the timer runs.
+    Use it as start()/stop() pair, as context manager or as decorator. OTimer.named() hands out shared timers.
+    """
+    SUB_BUCKET_BITS: int = _SUB_BUCKET_BITS
+    SUB_BUCKETS: int = 1 << SUB_BUCKET_BITS
+    # durations up to 2^63 ns
+    BUCKETS: int = (64 - SUB_BUCKET_BITS) * SUB_BUCKETS
+    # name -> timer, see named()
+    timers: Dict[str, 'OTimer'] = {}
+    NO_MIN: int = 1 << 63
+
     def __init__(self, name: str) -> None:
-        self.name = name
-        self.sum = 0
-        self.start_time = 0
-        self.fps = 0
-        self.start_count = 0
+        self.name: str = name
+        self.sum: int = 0
+        self.start_time: int = 0
+        # when fps() was called last
+        self.last_frame: int = 0
+        self.start_count: int = 0
+        # no Optional, saves a comparison on every stop()
+        self.min: int = OTimer.NO_MIN
+        self.max: int = 0
+        self.buckets: List[int] = [0] * OTimer.BUCKETS
+
+    @staticmethod
+    def named(name: str) -> 'OTimer':
+        """the timer registered under name, created on first use"""
+        timer: Optional[OTimer] = OTimer.timers.get(name)
+        if timer is None:
+            timer = OTimer.timers.setdefault(name, OTimer(name))
+        return timer
+
+    @staticmethod
+    def print_all():
+        for timer in OTimer.timers.values():
+            print(timer.summary())
+
+    @staticmethod
+    def bucket(duration: int) -> int:
+        if duration < _LINEAR_BUCKETS:
+            return max(0, duration)
+        shift: int = duration.bit_length() - _SHIFT_OFFSET
+        return (shift << _SUB_BUCKET_BITS) + (duration >> shift)
+
+    @staticmethod
+    def bucket_bounds(bucket: int) -> Tuple[int, int]:
+        """lowest and highest duration that falls into bucket"""
+        if bucket < _LINEAR_BUCKETS:
+            return bucket, bucket
+        shift: int = (bucket >> OTimer.SUB_BUCKET_BITS) - 1
+        mantissa: int = (bucket & (OTimer.SUB_BUCKETS - 1)) + OTimer.SUB_BUCKETS
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
 
     def start(self) -> 'OTimer':
-        self.start_time = time.time()
+        self.start_time = _now()
+        return self
+
+    def stop(self) -> 'OTimer':
+        # record() inlined, the call would cost more than the rest of this
+        duration: int = _now() - self.start_time
+        self.sum += duration
+        self.start_count += 1
+        if duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+        if duration < _LINEAR_BUCKETS:
+            self.buckets[duration] += 1
+        else:
+            shift: int = duration.bit_length() - _SHIFT_OFFSET
+            self.buckets[(shift << _SUB_BUCKET_BITS) + (duration >> shift)] += 1
+        return self
+
+    def record(self, duration: int) -> 'OTimer':
+        """adds a duration in ns, as if measured between start() and stop()"""
+        self.sum += duration
         self.start_count += 1
+        if duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+        self.buckets[OTimer.bucket(duration)] += 1
         return self
 
+    def __enter__(self) -> 'OTimer':
+        self.start_time = _now()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def __call__(self, fn: Callable) -> Callable:
+        """times every call of fn, recursive or concurrent calls do not get into each other's way"""
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs) -> Any:
+            started: int = _now()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(_now() - started)
+
+        return timed
+
     def fps(self) -> int:
-        duration = (time.time() - self.fps)
-        self.fps = time.time()
+        """calls per second, judging by the time since the last call"""
+        now: int = _now()
+        duration: int = now - self.last_frame
+        self.last_frame = now
         if duration > 0:
-            return int(1000 / duration)
+            return int(1e9 / duration)
         return 0
 
     def __str__(self) -> str:
         return f"Timer[{self.name}]: {self.get_duration_in_ms()}ms"
 
-    def stop(self) -> 'OTimer':
-        self.sum += int((time.time() - self.start_time) * 1e9)
-        return self
-
     def get_duration_in_ms(self) -> int:
         return int(self.sum / 1e6)
 
@@ -35,7 +146,8 @@ class OTimer:
         return self.sum
 
     def get_duration_in_s(self) -> int:
-        return int((time.time() - self.start_time))
+        """seconds since the last start()"""
+        return int((_now() - self.start_time) / 1e9)
 
     def print(self) -> 'OTimer':
         print(f"{self.__class__.__name__}.'{self.name}'.print: {self.get_duration_in_ms()}")
@@ -44,10 +156,315 @@ class OTimer:
     def reset(self) -> 'OTimer':
         self.sum = 0
         self.start_count = 0
+        self.min = OTimer.NO_MIN
+        self.max = 0
+        self.buckets = [0] * OTimer.BUCKETS
         return self
 
+    def merge(self, other: OTimer) -> OTimer:
+        """adds the durations other recorded"""
+        self.sum += other.sum
+        self.start_count += other.start_count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for bucket, count in enumerate(other.buckets):
+            if count > 0:
+                self.buckets[bucket] += count
+        return self
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the histogram is mostly zeros, this is sent back from Workhorse workers a lot
+        state: Dict[str, Any] = dict(self.__dict__)
+        state["buckets"] = {bucket: count for bucket, count in enumerate(self.buckets) if count > 0}
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        buckets: Dict[int, int] = state.pop("buckets")
+        self.__dict__.update(state)
+        self.buckets = [0] * OTimer.BUCKETS
+        for bucket, count in buckets.items():
+            self.buckets[bucket] = count
+
     def get_start_count(self) -> int:
         return self.start_count
 
     def get_average_duration(self) -> int:
+        """in ns"""
         return int(self.sum / self.start_count)
+
+    def percentile(self, p: float) -> int:
+        """
+        Nearest rank percentile in ns. It is the middle of the bucket the rank falls into, clamped to min and max.
+        """
+        if self.start_count == 0:
+            return 0
+        rank: int = max(1, min(self.start_count, math.ceil(self.start_count * p / 100)))
+        seen: int = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                low, high = OTimer.bucket_bounds(bucket)
+                return min(self.max, max(self.min, (low + high) // 2))
+        return self.max
+
+    def stats(self) -> Dict[str, int]:
+        """all in ns except count"""
+        return {
+            "count": self.start_count,
+            "sum": self.sum,
+            "min": self.min if self.start_count > 0 else 0,
+            "max": self.max,
+            "mean": self.get_average_duration() if self.start_count > 0 else 0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+        }
+
+    def summary(self) -> str:
+        s: Dict[str, int] = self.stats()
+        return f"Timer[{self.name}]: {s['count']} runs, {s['sum'] / 1e6:.3f}ms in total, " + \
+            ", ".join(f"{key} {s[key] / 1e3:.1f}us" for key in ["min", "mean", "p50", "p90", "p99", "p999", "max"])
+
+
+class OSpan(OTimer):
+    """
+    A named section in a tree of spans. The OTimer numbers are inclusive, children are the sections that were opened
+    while this one was open.
+    """
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self.children: Dict[str, OSpan] = {}
+
+    def child(self, name: str) -> OSpan:
+        node: Optional[OSpan] = self.children.get(name)
+        if node is None:
+            node = self.children[name] = OSpan(name)
+        return node
+
+    def exclusive_ns(self) -> int:
+        """time spent in this section but not in one of its children"""
+        return max(0, self.sum - sum(child.sum for child in self.children.values()))
+
+    def merge(self, other: OSpan) -> OSpan:
+        super().merge(other)
+        for name, child in other.children.items():
+            self.child(name).merge(child)
+        return self
+
+    def walk(self, path: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], OSpan]]:
+        """(names from the first level down to the node, node) of every node below this one, depth first"""
+        for name, child in self.children.items():
+            yield path + (name,), child
+            yield from child.walk(path + (name,))
+
+    def collapsed(self) -> str:
+        """'a;b;c <exclusive ns>' per line, the input of flamegraph.pl, speedscope and the like"""
+        return "".join(f"{';'.join(path)} {node.exclusive_ns()}\n" for path, node in self.walk()
+                       if node.exclusive_ns() > 0)
+
+    def print_tree(self, indent: str = ""):
+        for name, child in self.children.items():
+            print(f"{indent}{name}: {child.start_count}x, inclusive {child.sum / 1e6:.3f}ms, "
+                  f"exclusive {child.exclusive_ns() / 1e6:.3f}ms")
+            child.print_tree(indent + "  ")
+
+
+# (name, pid, thread id, perf_counter_ns at start, duration ns), perf_counter_ns is the same clock in all processes
+SpanEvent = Tuple[str, int, int, int, int]
+
+
+class OSpanCapture:
+    """What OSpans.take() hands over: the span tree of a thread and its events, Workhorse workers send this back."""
+
+    def __init__(self, root: OSpan, events: List[SpanEvent]):
+        self.root: OSpan = root
+        self.events: List[SpanEvent] = events
+
+
+class OSpanState:
+    """Spans of a single thread, no other thread writes to them."""
+
+    def __init__(self, capacity: int):
+        self.root: OSpan = OSpan("")
+        self.stack: List[OSpan] = [self.root]
+        self.events: Deque[SpanEvent] = deque(maxlen=capacity)
+        self.pid: int = os.getpid()
+        self.tid: int = threading.get_ident()
+
+
+class OSpanContext:
+    """Returned by OSpans.span(), use it with 'with'."""
+    __slots__ = ("name", "node", "started", "state")
+
+    def __init__(self, name: str):
+        self.name: str = name
+
+    def __enter__(self) -> OSpanContext:
+        state: OSpanState = OSpans.state()
+        node: OSpan = state.stack[-1].child(self.name)
+        state.stack.append(node)
+        self.state = state
+        self.node = node
+        self.started = _now()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration: int = _now() - self.started
+        state: OSpanState = self.state
+        state.stack.pop()
+        self.node.record(duration)
+        if OSpans.capacity > 0:
+            state.events.append((self.name, state.pid, state.tid, self.started, duration))
+
+
+class OSpanNothing:
+    """Returned by OSpans.span() while spans are off."""
+    __slots__ = ()
+
+    def __enter__(self) -> OSpanNothing:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class OSpans:
+    """
+    Nested timing sections of this process, every thread builds its own tree:
+
+        with OSpans.span("load"):
+            with OSpans.span("parse"):
+                ...
+
+    Off by default, OSpans.span() then costs about as much as an empty with statement. Workhorse.spans() collects
+    the trees of its workers and merges them in here. Export with collapsed() for flame graphs or chrome_trace().
+    """
+    enabled: bool = False
+    # events kept per thread for chrome_trace(), 0 keeps none
+    capacity: int = 100_000
+    local: threading.local = threading.local()
+    # the state of every thread that opened a span
+    states: List[OSpanState] = []
+    # what other processes sent, see merge()
+    received: OSpan = OSpan("")
+    received_events: List[SpanEvent] = []
+    lock: threading.Lock = threading.Lock()
+    NOTHING: OSpanNothing = OSpanNothing()
+
+    @staticmethod
+    def enable(enabled: bool = True, capacity: Optional[int] = None):
+        OSpans.enabled = enabled
+        if capacity is not None:
+            OSpans.capacity = capacity
+
+    @staticmethod
+    def span(name: str) -> OSpanContext | OSpanNothing:
+        if not OSpans.enabled:
+            return OSpans.NOTHING
+        return OSpanContext(name)
+
+    @staticmethod
+    def spanned(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+        """decorator, the span is named after the function unless you name it"""
+
+        def decorate(fn: Callable) -> Callable:
+            span_name: str = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def spanned_fn(*args, **kwargs) -> Any:
+                if not OSpans.enabled:
+                    return fn(*args, **kwargs)
+                with OSpanContext(span_name):
+                    return fn(*args, **kwargs)
+
+            return spanned_fn
+
+        return decorate
+
+    @staticmethod
+    def state() -> OSpanState:
+        state: Optional[OSpanState] = getattr(OSpans.local, "state", None)
+        if state is None:
+            state = OSpans.local.state = OSpanState(OSpans.capacity)
+            with OSpans.lock:
+                OSpans.states.append(state)
+        return state
+
+    @staticmethod
+    def take() -> OSpanCapture:
+        """hands over what the calling thread recorded and starts over"""
+        state: OSpanState = OSpans.state()
+        capture: OSpanCapture = OSpanCapture(state.root, list(state.events))
+        state.root = OSpan("")
+        # spans still open were created in the old tree and end up there
+        state.stack = [state.root] + state.stack[1:]
+        state.events.clear()
+        return capture
+
+    @staticmethod
+    def merge(capture: OSpanCapture):
+        with OSpans.lock:
+            OSpans.received.merge(capture.root)
+            OSpans.received_events.extend(capture.events)
+
+    @staticmethod
+    def tree() -> OSpan:
+        """all threads and everything received merged into one tree"""
+        root: OSpan = OSpan("")
+        with OSpans.lock:
+            for state in OSpans.states:
+                root.merge(state.root)
+            root.merge(OSpans.received)
+        return root
+
+    @staticmethod
+    def events() -> List[SpanEvent]:
+        with OSpans.lock:
+            events: List[SpanEvent] = [event for state in OSpans.states for event in state.events]
+            return events + OSpans.received_events
+
+    @staticmethod
+    def reset():
+        with OSpans.lock:
+            for state in OSpans.states:
+                state.root = OSpan("")
+                state.stack = [state.root]
+                state.events.clear()
+            OSpans.received = OSpan("")
+            OSpans.received_events = []
+
+    @staticmethod
+    def _after_fork():
+        # the parent's spans stay with the parent
+        OSpans.local = threading.local()
+        OSpans.states = []
+        OSpans.received = OSpan("")
+        OSpans.received_events = []
+        OSpans.lock = threading.Lock()
+
+    @staticmethod
+    def collapsed() -> str:
+        return OSpans.tree().collapsed()
+
+    @staticmethod
+    def save_collapsed(file: Path):
+        with open(file, "w") as f:
+            f.write(OSpans.collapsed())
+
+    @staticmethod
+    def chrome_trace() -> Dict[str, Any]:
+        """Trace event format, load it in chrome://tracing or https://ui.perfetto.dev"""
+        return {"traceEvents": [{"name": name, "ph": "X", "pid": pid, "tid": tid, "ts": start / 1e3, "dur": duration / 1e3}
+                                for name, pid, tid, start, duration in OSpans.events()],
+                "displayTimeUnit": "ms"}
+
+    @staticmethod
+    def save_chrome_trace(file: Path):
+        import json
+        with open(file, "w") as f:
+            json.dump(OSpans.chrome_trace(), f)
+
+
+os.register_at_fork(after_in_child=OSpans._after_fork)
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+from typing import Dict, List
+from unittest import TestCase
+
+
+class TestImport(TestCase):
+    def run_python(self, code: str, *options: str) -> subprocess.CompletedProcess:
+        env: Dict[str, str] = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in sys.path if p != "")
+        return subprocess.run([sys.executable, *options, "-c", code], capture_output=True, text=True, env=env,
+                              check=True, cwd=os.getcwd())
+
+    def import_times(self, module: str) -> Dict[str, int]:
+        """module -> cumulative import time in us, from -X importtime"""
+        stderr: str = self.run_python(f"import {module}", "-X", "importtime").stderr
+        times: Dict[str, int] = {}
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line.split("|")
+            times[name.strip()] = int(cumulative)
+        return times
+
+    def test_silent_import(self):
+        limit: int = int(self.run_python("import sys; print(sys.getrecursionlimit())").stdout)
+        out: str = self.run_python("import sys, shared; print(sys.getrecursionlimit())").stdout
+        self.assertEqual(f"{limit}\n", out)
+
+    def test_lazy_loading(self):
+        code: str = "import sys, shared; loaded = set(sys.modules); " \
+                    "from shared import Lok; print(sorted(m for m in sys.modules if m not in loaded))"
+        loaded: List[str] = eval(self.run_python(code).stdout)
+        self.assertIn("shared.lok", loaded)
+        self.assertNotIn("shared.workhorse", loaded)
+        for heavy in ["concurrent.futures", "inspect", "multiprocessing"]:
+            self.assertNotIn(heavy, loaded)
+        out: str = self.run_python("import shared; print(shared.js3dec.JS3Dec.__name__, shared.Workhorse.__name__)").stdout
+        self.assertEqual("JS3Dec Workhorse\n", out)
+
+    def test_import_time(self):
+        package: Dict[str, int] = self.import_times("shared")
+        self.assertEqual(["shared"], [name for name in package if name.startswith("shared")])
+        workhorse: Dict[str, int] = self.import_times("shared.workhorse")
+        self.assertNotIn("concurrent.futures.process", workhorse)
+        self.assertNotIn("inspect", workhorse)
+        lok: Dict[str, int] = self.import_times("shared.lok")
+        print(f"import time: package {package['shared'] / 1e3:.1f}ms, lok {lok['shared.lok'] / 1e3:.1f}ms, "
+              f"workhorse {workhorse['shared.workhorse'] / 1e3:.1f}ms")
+        self.assertLess(package["shared"], 20_000)
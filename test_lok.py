@@ -0,0 +1,201 @@
+import gzip
+import io
+import json
+import pickle
+import shutil
+import sys
+import threading
+import time
+
+from contextlib import redirect_stdout
+from pathlib import Path
+from shared.lok import Lok, LokLevel, LokFileSink
+from shared.otimer import OTimer
+from shared.workhorse import Workhorse, Workload
+from typing import Any
+from unittest import TestCase
+
+
+class LoggingWorkload(Workload):
+    def __init__(self, i: int):
+        super().__init__()
+        self.i: int = i
+
+    def run_impl(self) -> Any:
+        for j in range(3):
+            self.lok(f"workload {self.i} line {j}")
+        return self.i
+
+
+class TestLok(TestCase):
+    def tearDown(self):
+        Lok.stop_writer()
+        for sink in Lok.sinks:
+            Lok.remove_sink(sink)
+        Lok.console = True
+
+    def test_writer(self):
+        lok: Lok = Lok(name="writer")
+        out = io.StringIO()
+        with redirect_stdout(out):
+            Lok.start_writer()
+            for i in range(1000):
+                lok(f"line {i}\nsecond part")
+            Lok.stop_writer()
+        lines = out.getvalue().splitlines()
+        self.assertEqual(2000, len(lines))
+        self.assertTrue(lines[0].startswith("[writer] [MainProcess], "))
+        self.assertTrue(lines[0].endswith(": line 0"))
+        self.assertTrue(lines[-1].endswith(": second part"))
+        self.assertTrue(lines[-2].endswith(": line 999"))
+
+    def test_listener(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            Lok.start_listener()
+            wh: Workhorse = Workhorse(threads=2)
+            for i in range(4):
+                wh.add_runnable(LoggingWorkload(i))
+            self.assertEqual([0, 1, 2, 3], wh.join())
+            Lok.stop_writer()
+        worker_lines = [line for line in out.getvalue().splitlines() if line.startswith("[LoggingWorkload]")]
+        self.assertEqual(12, len(worker_lines))
+        self.assertTrue(all("MainProcess" not in line for line in worker_lines))
+
+    def test_queued_call_cost(self):
+        lok: Lok = Lok(name="bench")
+        n: int = 20_000
+        out = io.StringIO()
+        with redirect_stdout(out):
+            Lok.start_writer()
+            start: float = time.perf_counter()
+            for i in range(n):
+                lok("constant message")
+            queued: float = (time.perf_counter() - start) / n
+            Lok.stop_writer()
+            start = time.perf_counter()
+            for i in range(n):
+                lok("constant message")
+            printed: float = (time.perf_counter() - start) / n
+        print(f"queued Lok call: {queued * 1e6:.2f}us, printed Lok call: {printed * 1e6:.2f}us")
+        self.assertLess(queued, printed)
+
+    def test_levels(self):
+        lok: Lok = Lok(name="levels", level=LokLevel.WARNING)
+        calls = []
+        out = io.StringIO()
+        with redirect_stdout(out):
+            lok.debug(lambda: calls.append("debug"))
+            lok.info("%s %d", "info", 1)
+            lok("plain")
+            lok.warning(lambda: "lazy %s" % "warning")
+            lok.set_level(LokLevel.DEBUG)
+            lok.debug("%s=%d", "x", 3)
+        self.assertEqual([], calls)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].endswith(": lazy warning"))
+        self.assertTrue(lines[1].endswith(": x=3"))
+
+    def test_ring_buffer(self):
+        lok: Lok = Lok(name="ring", capacity=3).set_enabled(False)
+        for i in range(10):
+            lok.info("line %d", i)
+        self.assertEqual(3, len(lok.stored))
+        self.assertEqual(["line 7", "line 8", "line 9"], [line.split(": ", 1)[1] for line in lok.stored_lines])
+        out = io.StringIO()
+        with redirect_stdout(out):
+            lok.print_self()
+        self.assertEqual(4, len(out.getvalue().splitlines()))
+
+    def test_stored_when_logged(self):
+        lok: Lok = Lok(name="stored").set_enabled(False)
+        d = {'k': 1}
+        lok(d)
+        lok.info(lambda: "lazy")
+        d['k'] = 2
+        self.assertEqual(["{'k': 1}", "lazy"], [line.split(": ", 1)[1] for line in lok.stored_lines])
+        self.assertEqual(lok.stored_lines, pickle.loads(pickle.dumps(lok)).stored_lines)
+
+    def test_callable_objects_print(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            Lok(name="callable")(OTimer("x"))
+            Lok(name="callable").print(OTimer("y"))
+        self.assertEqual(["Timer[x]: 0ms", "Timer[y]: 0ms"],
+                         [line.split(": ", 1)[1] for line in out.getvalue().splitlines()])
+
+    def test_suppressed_call_cost(self):
+        lok: Lok = Lok(name="bench", level=LokLevel.INFO)
+        n: int = 200_000
+        start: float = time.perf_counter()
+        for i in range(n):
+            lok.debug("value %d of %s", i, lok)
+        suppressed: float = (time.perf_counter() - start) / n
+        start = time.perf_counter()
+        for i in range(n):
+            pass
+        empty: float = (time.perf_counter() - start) / n
+        print(f"suppressed Lok call: {(suppressed - empty) * 1e9:.0f}ns")
+        self.assertLess(suppressed - empty, 1e-6)
+
+    def test_file_sink_first_writes_from_threads(self):
+        directory: Path = Path("test_lok_sink_threads")
+        shutil.rmtree(directory, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, directory, True)
+        sink: LokFileSink = LokFileSink(directory, flush_bytes=1000)
+        flushers: int = len([t for t in threading.enumerate() if t.name == "LokFileSink"])
+        barrier = threading.Barrier(8)
+
+        def write(n: int):
+            barrier.wait()
+            for i in range(100):
+                sink.write(time.time(), "threads", "main", LokLevel.INFO.value, f"{n} {i}")
+
+        # switch threads as often as possible, all of them meet the sink unopened
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-6)
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(flushers + 1, len([t for t in threading.enumerate() if t.name == "LokFileSink"]))
+        sink.close()
+        with open(sink.path()) as f:
+            self.assertEqual(800, len(f.readlines()))
+
+    def test_file_sink(self):
+        directory: Path = Path("test_lok_sink")
+        shutil.rmtree(directory, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, directory, True)
+        sink: LokFileSink = LokFileSink(directory, max_bytes=4000, flush_bytes=1000, flush_interval=0.05)
+        Lok.add_sink(sink)
+        Lok.console = False
+        lok: Lok = Lok(name="sink")
+        out = io.StringIO()
+        with redirect_stdout(out):
+            for i in range(100):
+                lok.warning("line %d", i)
+            wh: Workhorse = Workhorse(threads=2)
+            for i in range(4):
+                wh.add_runnable(LoggingWorkload(i))
+            self.assertEqual([0, 1, 2, 3], wh.join())
+            # the workers flush on their own clock
+            time.sleep(0.3)
+            Lok.remove_sink(sink)
+        self.assertEqual("", out.getvalue())
+        records = []
+        for file in directory.iterdir():
+            opener = gzip.open if file.suffix == ".gz" else open
+            with opener(file, "rt") as f:
+                records.extend(json.loads(line) for line in f)
+        self.assertTrue(any(f.suffix == ".gz" for f in directory.iterdir()))
+        self.assertFalse(any(f.name.endswith(".tmp") for f in directory.iterdir()))
+        own = [r for r in records if r["logger"] == "sink"]
+        self.assertEqual(100, len(own))
+        self.assertEqual({f"line {i}" for i in range(100)}, {r["message"] for r in own})
+        self.assertEqual({"WARNING"}, {r["level"] for r in own})
+        workers = [r for r in records if r["logger"] == "LoggingWorkload"]
+        self.assertEqual(12, len(workers))
+        self.assertTrue(all(r["pid"] != own[0]["pid"] for r in workers))
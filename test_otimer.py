@@ -0,0 +1,121 @@
+import pickle
+import random
+import time
+
+from shared.otimer import OTimer, OSpans, OSpan
+from unittest import TestCase
+
+
+class TestOTimer(TestCase):
+    def tearDown(self):
+        OSpans.enable(False)
+        OSpans.reset()
+
+    def test_buckets(self):
+        for duration in [0, 1, 31, 32, 33, 1000, 123_456_789, 2 ** 62 + 5]:
+            low, high = OTimer.bucket_bounds(OTimer.bucket(duration))
+            self.assertLessEqual(low, duration)
+            self.assertGreaterEqual(high, duration)
+            self.assertLessEqual(high - low, max(1, duration) / OTimer.SUB_BUCKETS)
+        timer: OTimer = OTimer("buckets")
+        timer.record(2 ** 62 + 5)
+        self.assertEqual(1, timer.buckets[OTimer.bucket(2 ** 62 + 5)])
+
+    def test_percentiles(self):
+        timer: OTimer = OTimer("percentiles")
+        durations = list(range(1, 100_001))
+        random.shuffle(durations)
+        for d in durations:
+            timer.record(d * 1000)
+        s = timer.stats()
+        self.assertEqual(100_000, s["count"])
+        self.assertEqual(1000, s["min"])
+        self.assertEqual(100_000_000, s["max"])
+        self.assertEqual(50_000_500, s["mean"])
+        for key, expected in [("p50", 50_000_000), ("p90", 90_000_000), ("p99", 99_000_000), ("p999", 99_900_000)]:
+            self.assertAlmostEqual(expected, s[key], delta=expected / OTimer.SUB_BUCKETS)
+        timer.reset()
+        self.assertEqual(0, timer.stats()["p99"])
+
+    def test_usage(self):
+        timer: OTimer = OTimer.named("usage")
+        self.assertIs(timer, OTimer.named("usage"))
+        with timer:
+            time.sleep(0.01)
+
+        @timer
+        def fib(n: int) -> int:
+            return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+        self.assertEqual(55, fib(10))
+        self.assertEqual("fib", fib.__name__)
+        self.assertEqual(1 + 177, timer.get_start_count())
+        self.assertGreaterEqual(timer.max, 10_000_000)
+        self.assertGreaterEqual(timer.get_duration_in_ms(), 10)
+        timer.start().stop()
+        self.assertEqual(179, timer.get_start_count())
+        timer.fps()
+        self.assertGreater(timer.fps(), 0)
+
+    def test_overhead(self):
+        timer: OTimer = OTimer("overhead")
+        n: int = 20_000
+        rounds = []
+        # best of a few rounds, like timeit, the rest is noise from the machine
+        for _ in range(5):
+            start: float = time.perf_counter()
+            for i in range(n):
+                timer.start()
+                timer.stop()
+            measured: float = (time.perf_counter() - start) / n
+            start = time.perf_counter()
+            for i in range(n):
+                pass
+            rounds.append(measured - (time.perf_counter() - start) / n)
+        overhead: float = min(rounds)
+        print(f"OTimer start/stop: {overhead * 1e9:.0f}ns")
+        self.assertLess(overhead, 1e-6)
+
+    def test_spans(self):
+        OSpans.enable()
+
+        @OSpans.spanned()
+        def leaf():
+            time.sleep(0.002)
+
+        with OSpans.span("outer"):
+            time.sleep(0.005)
+            for _ in range(3):
+                with OSpans.span("inner"):
+                    leaf()
+        tree: OSpan = OSpans.tree()
+        outer: OSpan = tree.children["outer"]
+        inner: OSpan = outer.children["inner"]
+        self.assertEqual(1, outer.get_start_count())
+        self.assertEqual(3, inner.get_start_count())
+        self.assertEqual(3, inner.children[leaf.__qualname__].get_start_count())
+        self.assertGreaterEqual(outer.exclusive_ns(), 5_000_000)
+        self.assertEqual(outer.sum - inner.sum, outer.exclusive_ns())
+        lines = OSpans.collapsed().splitlines()
+        self.assertEqual(["outer", "outer;inner", f"outer;inner;{leaf.__qualname__}"],
+                         [line.rsplit(" ", 1)[0] for line in lines])
+        events = OSpans.chrome_trace()["traceEvents"]
+        self.assertEqual(7, len(events))
+        self.assertEqual("outer", events[-1]["name"])
+
+        # sparse histograms, a worker sends this back for every workload
+        self.assertLess(len(pickle.dumps(tree)), 2000)
+        merged: OSpan = pickle.loads(pickle.dumps(tree)).merge(tree)
+        self.assertEqual(6, merged.children["outer"].children["inner"].get_start_count())
+        self.assertEqual(inner.max, merged.children["outer"].children["inner"].max)
+
+    def test_disabled_span_cost(self):
+        n: int = 100_000
+        start: float = time.perf_counter()
+        for i in range(n):
+            with OSpans.span("off"):
+                pass
+        disabled: float = (time.perf_counter() - start) / n
+        print(f"disabled span: {disabled * 1e9:.0f}ns")
+        self.assertEqual(0, len(OSpans.tree().children))
+        self.assertLess(disabled, 1e-6)
@@ -1,11 +1,47 @@
+import asyncio
+import json
+import os
+import pickle
 import shutil
+import threading
+import time
 
 from pathlib import Path
-from shared.workhorse import Workhorse, Workload
-from typing import Any
+from multiprocessing import shared_memory
+from shared.js3 import JS3, JS3Enc
+from shared.js3dec import JS3Dec
+from shared.otimer import OSpans
+from shared.workhorse import Workhorse, Workload, WorkhorseTransport, AutoBatchWorkload, SharedInput, \
+    WorkhorseBackend, InlineExecutor, ResultCache, JS3BatchWorkload, MapWorkload, Journal
+from typing import Any, Set, Optional, List
 from unittest import TestCase
 
 
+class JS3Item(JS3):
+    def __init__(self):
+        self.values: List[int] = []
+
+
+class Table(JS3):
+    def __init__(self):
+        self.rows: List[List[int]] = []
+
+
+class TableWorkload(Workload, JS3):
+    def __init__(self, table: Table, i: int):
+        super().__init__()
+        self.table: Table = table
+        self.i: int = i
+
+    def run_impl(self) -> Any:
+        return sum(self.table.rows[self.i])
+
+
+class BytesTableWorkload(TableWorkload):
+    def run_impl(self) -> Any:
+        return bytes(self.table.rows[self.i][:3])
+
+
 class FileWorkload(Workload):
     def __init__(self, f: Path):
         super().__init__()
@@ -18,6 +54,146 @@ class FileWorkload(Workload):
         return 11
 
 
+class BigInputWorkload(Workload):
+    state_fields: Set[str] = {'checksum'}
+
+    def __init__(self, payload: bytes):
+        super().__init__()
+        self.payload: bytes = payload
+        self.checksum: Optional[int] = None
+
+    def run_impl(self) -> Any:
+        self.checksum = sum(self.payload[::4096])
+        return len(self.payload)
+
+
+class SharedInputWorkload(Workload):
+    def __init__(self, data: SharedInput, offset: int):
+        super().__init__()
+        self.data: SharedInput = data
+        self.offset: int = offset
+
+    def run_impl(self) -> Any:
+        view: memoryview = self.data.view()
+        return view[self.offset] + view[-1]
+
+
+class SleepyWorkload(Workload):
+    running: int = 0
+    max_running: int = 0
+
+    def __init__(self, i: int):
+        super().__init__()
+        self.i: int = i
+
+    async def run_impl(self) -> Any:
+        SleepyWorkload.running += 1
+        SleepyWorkload.max_running = max(SleepyWorkload.max_running, SleepyWorkload.running)
+        await asyncio.sleep(0.01)
+        SleepyWorkload.running -= 1
+        return self.i * 2
+
+
+class AsyncSumWorkload(Workload):
+    def __init__(self, value: int, seconds: float = 0.0):
+        super().__init__()
+        self.value: int = value
+        self.seconds: float = seconds
+
+    async def run_impl(self) -> Any:
+        await asyncio.sleep(self.seconds)
+        return self.value + sum(self.upstream_results)
+
+
+class KeyedWorkload(Workload):
+    cache_ignored: Set[str] = {'note'}
+
+    def __init__(self, tags: Set[str], note: str):
+        super().__init__()
+        self.tags: Set[str] = tags
+        self.note: str = note
+
+    def run_impl(self) -> Any:
+        return sorted(self.tags)
+
+
+class FlakyWorkload(Workload):
+    """fails until it has been tried attempts times, counted by files in a directory"""
+    def __init__(self, directory: Path, attempts: int):
+        super().__init__()
+        self.directory: Path = directory
+        self.attempts: int = attempts
+
+    def run_impl(self) -> Any:
+        tried: int = len(list(self.directory.glob(f"attempt_{self.index}_*")))
+        Path(self.directory, f"attempt_{self.index}_{tried}").touch()
+        if tried + 1 < self.attempts:
+            raise ValueError(f"attempt {tried + 1}")
+        return self.index
+
+
+class SlowWorkload(Workload):
+    def __init__(self, seconds: float):
+        super().__init__()
+        self.seconds: float = seconds
+
+    def run_impl(self) -> Any:
+        time.sleep(self.seconds)
+        return self.seconds
+
+
+class CrashingWorkload(Workload):
+    def run_impl(self) -> Any:
+        os._exit(1)
+
+
+class LockWorkload(Workload):
+    def run_impl(self) -> Any:
+        return threading.Lock()
+
+
+class SumWorkload(Workload):
+    def __init__(self, value: int, seconds: float = 0.0):
+        super().__init__()
+        self.value: int = value
+        self.seconds: float = seconds
+
+    def run_impl(self) -> Any:
+        time.sleep(self.seconds)
+        if self.value < 0:
+            raise ValueError("negative")
+        return self.value + sum(self.upstream_results)
+
+
+class JS3RoundTripWorkload(Workload):
+    def __init__(self, i: int):
+        super().__init__()
+        self.i: int = i
+
+    def run_impl(self) -> Any:
+        item = JS3Item()
+        item.values = list(range(self.i * 100))
+        return len(JS3Dec().source(JS3Enc(item).encode()).decode().values)
+
+
+def square(x: int) -> int:
+    return x * x
+
+
+def cube(x: int) -> int:
+    return x * x * x
+
+
+def add(a: int, b: int) -> int:
+    return a + b
+
+
+def fail_on_13(x: int) -> int:
+    if x == 13:
+        raise ValueError("13")
+    return x
+
+
 class TestWorkhorse(TestCase):
     def setUp(self):
         self.directory: Path = Path("test_workhorse")
@@ -35,3 +211,484 @@ class TestWorkhorse(TestCase):
             wh.add_runnable(FileWorkload(f=Path(self.directory, f"f{i}.txt")))
         wh.join()
         print('asdasd')
+
+    def test_result_transport(self):
+        wh: Workhorse = self.wh.transport(WorkhorseTransport.RESULT)
+        workloads = [BigInputWorkload(payload=bytes([i]) * 100_000) for i in range(5)]
+        for w in workloads:
+            wh.add_runnable(w)
+        results = wh.join()
+        self.assertEqual([100_000] * 5, results)
+        for i, w in enumerate(workloads):
+            # the parent's own objects are filled, including the declared state
+            self.assertTrue(w.executed)
+            self.assertEqual(100_000, w.result)
+            self.assertEqual(sum((bytes([i]) * 100_000)[::4096]), w.checksum)
+
+    def test_result_transport_unbatched(self):
+        wh: Workhorse = Workhorse(threads=2).transport(WorkhorseTransport.RESULT)
+        workloads = [BigInputWorkload(payload=bytes([i]) * 1000) for i in range(3)]
+        for w in workloads:
+            wh.add_runnable(w)
+        self.assertEqual([1000] * 3, wh.join())
+        self.assertEqual([w.checksum for w in workloads], [sum((bytes([i]) * 1000)[::4096]) for i in range(3)])
+
+    def test_result_transport_ipc_bytes(self):
+        def returned_bytes(transport: WorkhorseTransport) -> int:
+            workloads = [BigInputWorkload(payload=b'x' * 1_000_000) for _ in range(4)]
+            for i, w in enumerate(workloads):
+                w.index = i
+            return len(pickle.dumps(AutoBatchWorkload(workloads, transport=transport).get_result()))
+
+        full: int = returned_bytes(WorkhorseTransport.FULL)
+        result: int = returned_bytes(WorkhorseTransport.RESULT)
+        print(f"returned bytes: full={full}, result={result}")
+        self.assertGreater(full, 4_000_000)
+        self.assertLess(result, 1_000)
+
+    def test_shared_input(self):
+        wh: Workhorse = Workhorse(threads=2).transport(WorkhorseTransport.RESULT)
+        data: bytearray = bytearray(range(256)) * 4
+        handle: SharedInput = wh.share(data)
+        for i in range(6):
+            wh.add_runnable(SharedInputWorkload(data=handle, offset=i))
+        self.assertEqual([i + 255 for i in range(6)], wh.join())
+        # the segment is gone after join
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=handle.name)
+
+    def test_shared_input_released_on_reset(self):
+        wh: Workhorse = Workhorse(threads=1)
+        handle: SharedInput = wh.share(b'abc')
+        self.assertEqual(b'abc', bytes(handle.view()))
+        wh.reset()
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=handle.name)
+
+    def test_shared_input_hashed_once(self):
+        wh: Workhorse = Workhorse(threads=1)
+        same: List[str] = [SharedInputWorkload(data=wh.share(b'abc'), offset=0).cache_key() for _ in range(2)]
+        other: SharedInputWorkload = SharedInputWorkload(data=wh.share(b'abd'), offset=0)
+        wh.reset()
+        # the segments are gone, the keys come from the digests share() took
+        self.assertEqual(same[0], same[1])
+        self.assertNotEqual(same[0], other.cache_key())
+
+    def test_shared_input_ipc_independent_of_size(self):
+        pickled: List[int] = []
+        for size in [1_000, 1_000_000, 32_000_000]:
+            wh: Workhorse = Workhorse(threads=2).batch().transport(WorkhorseTransport.RESULT)
+            handle: SharedInput = wh.share(bytes(size))
+            workloads = [SharedInputWorkload(data=handle, offset=i) for i in range(4)]
+            pickled.append(len(pickle.dumps(workloads[0])))
+            for w in workloads:
+                wh.add_runnable(w)
+            start: float = time.perf_counter()
+            self.assertEqual([0] * 4, wh.join())
+            print(f"payload {size} bytes: workload pickles to {pickled[-1]} bytes, join took "
+                  f"{(time.perf_counter() - start) * 1000:.1f}ms")
+        # only the integer encoding of the size differs
+        self.assertLess(max(pickled) - min(pickled), 8)
+
+    def run_file_workloads(self, wh: Workhorse) -> List[Any]:
+        for i in range(5):
+            wh.add_runnable(FileWorkload(f=Path(self.directory, f"f{i}.txt")))
+        results = wh.join()
+        self.assertEqual(5, len(list(self.directory.iterdir())))
+        return results
+
+    def test_thread_backend(self):
+        self.assertEqual([11] * 5, self.run_file_workloads(Workhorse(threads=2, backend=WorkhorseBackend.THREAD)))
+
+    def test_thread_backend_batch(self):
+        wh: Workhorse = Workhorse(threads=2, backend=WorkhorseBackend.THREAD).batch(2)
+        self.assertEqual([11] * 5, self.run_file_workloads(wh))
+
+    def test_inline_backend(self):
+        self.assertEqual([11] * 5, self.run_file_workloads(Workhorse(threads=2, backend=WorkhorseBackend.INLINE)))
+
+    def test_auto_backend(self):
+        wh: Workhorse = Workhorse(threads=2, backend=WorkhorseBackend.AUTO)
+        self.assertEqual([11] * 5, self.run_file_workloads(wh))
+        # touching five files is way quicker than spawning processes
+        self.assertIsInstance(wh.executor, InlineExecutor)
+
+    def test_asyncio_backend(self):
+        SleepyWorkload.max_running = 0
+        wh: Workhorse = Workhorse(threads=3, backend=WorkhorseBackend.ASYNCIO)
+        for i in range(10):
+            wh.add_runnable(SleepyWorkload(i))
+        self.assertEqual([i * 2 for i in range(10)], wh.join())
+        self.assertEqual(3, SleepyWorkload.max_running)
+
+    def test_async_workload_on_process_backend(self):
+        wh: Workhorse = Workhorse(threads=2)
+        for i in range(3):
+            wh.add_runnable(SleepyWorkload(i))
+        self.assertEqual([0, 2, 4], wh.join())
+
+    def test_cache(self):
+        cache_dir: Path = Path(f"{self.directory}_cache")
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, cache_dir)
+        wh: Workhorse = Workhorse(threads=2).cache(cache_dir)
+        self.assertEqual([11] * 5, self.run_file_workloads(wh))
+        self.assertEqual(5, len(list(cache_dir.glob('*.pkl'))))
+        # a FileWorkload fails if its file already exists, so these must all be cache hits
+        wh = Workhorse(threads=2).cache(cache_dir)
+        for i in range(5):
+            wh.add_runnable(FileWorkload(f=Path(self.directory, f"f{i}.txt")))
+        self.assertEqual([11] * 5, wh.join())
+        self.assertEqual(5, wh._cache.hits)
+        self.assertEqual(0, wh._cache.misses)
+
+    def test_cache_key(self):
+        a = KeyedWorkload(tags={'x', 'y', 'z'}, note='a')
+        b = KeyedWorkload(tags={'z', 'y', 'x'}, note='b')
+        b.index = 7
+        self.assertEqual(a.cache_key(), b.cache_key())
+        self.assertNotEqual(a.cache_key(), KeyedWorkload(tags={'x'}, note='a').cache_key())
+
+    def test_cache_key_functions(self):
+        cache_dir: Path = Path(f"{self.directory}_cache")
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        self.assertEqual([1, 4, 9], Workhorse(threads=2).cache(cache_dir).map(square, [1, 2, 3]))
+        wh: Workhorse = Workhorse(threads=2).cache(cache_dir)
+        self.assertEqual([1, 8, 27], wh.map(cube, [1, 2, 3]))
+        self.assertEqual(0, wh._cache.hits)
+        wh = Workhorse(threads=2).cache(cache_dir)
+        self.assertEqual([1, 4, 9], wh.map(square, [1, 2, 3]))
+        self.assertEqual(wh._cache.misses, 0)
+        k: int = 2
+        keys = {MapWorkload(f, [1]).cache_key() for f in [lambda x: x + 1, lambda x: x + 2, lambda x: x * k,
+                                                            "a".upper, "a".lower, print, len, int, str]}
+        self.assertEqual(9, len(keys))
+        # classes used to make cache_key() raise
+        self.assertNotEqual(KeyedWorkload(tags={int}, note='a').cache_key(),
+                            KeyedWorkload(tags={float}, note='a').cache_key())
+
+    def test_cache_eviction(self):
+        cache: ResultCache = ResultCache(Path(self.directory, "cache"), max_bytes=2500)
+        for i in range(5):
+            cache.put(f"k{i}", bytes(1000))
+            time.sleep(0.01)
+        self.assertTrue(cache.get("k0")[0])
+        cache.evict()
+        # k0 was used most recently
+        self.assertEqual({"k0.pkl", "k4.pkl"}, {p.name for p in cache.directory.glob('*.pkl')})
+
+    def test_journal_resume(self):
+        journal: Path = Path(f"{self.directory}_journal.pkl")
+        self.addCleanup(journal.unlink, True)
+        journal.unlink(missing_ok=True)
+        self.run_file_workloads(Workhorse(threads=2).journal(journal))
+        # cut the journal in the middle of the fourth record like a killed job would
+        with open(journal, 'rb') as f:
+            done: List[int] = [pickle.load(f)[0] for _ in range(3)]
+            cut: int = f.tell() + 5
+        os.truncate(journal, cut)
+        for i in set(range(5)) - set(done):
+            Path(self.directory, f"f{i}.txt").unlink()
+        # the journaled ones are replayed, their files exist and running them again would fail
+        wh: Workhorse = Workhorse(threads=2).journal(journal)
+        for i in range(5):
+            wh.add_runnable(FileWorkload(f=Path(self.directory, f"f{i}.txt")))
+        self.assertEqual([11] * 5, wh.join())
+        self.assertEqual({}, wh.failures)
+        self.assertEqual(5, len(wh._journal.entries))
+
+    def test_journal_keeps_records_that_do_not_load(self):
+        journal: Path = Path(f"{self.directory}_journal.pkl")
+        self.addCleanup(journal.unlink, True)
+        gone = type("Gone", (), {"__module__": __name__})
+        globals()["Gone"] = gone
+        with open(journal, 'wb') as f:
+            for index, result in enumerate([1, gone(), 3]):
+                pickle.dump((index, "key", result), f)
+        del globals()["Gone"]
+        size: int = journal.stat().st_size
+        self.assertEqual({0: ("key", 1), 2: ("key", 3)}, Journal(journal).entries)
+        self.assertEqual(size, journal.stat().st_size)
+        # a cut off tail still goes away
+        with open(journal, 'ab') as f:
+            f.write(pickle.dumps((3, "key", 4))[:-3])
+        self.assertEqual([0, 2], list(Journal(journal).entries))
+        self.assertEqual(size, journal.stat().st_size)
+
+    def test_failure_is_reported(self):
+        wh: Workhorse = Workhorse(threads=2)
+        for _ in range(3):
+            wh.add_runnable(FlakyWorkload(directory=self.directory, attempts=2))
+        self.assertEqual([None] * 3, wh.join())
+        self.assertEqual({0, 1, 2}, set(wh.failures.keys()))
+        self.assertIn("ValueError", wh.failures[0])
+
+    def test_retry(self):
+        wh: Workhorse = Workhorse(threads=2).batch(2).retry(retries=2)
+        for _ in range(5):
+            wh.add_runnable(FlakyWorkload(directory=self.directory, attempts=3))
+        self.assertEqual(list(range(5)), wh.join())
+        self.assertEqual({}, wh.failures)
+
+    def test_retry_asyncio(self):
+        wh: Workhorse = Workhorse(threads=2, backend=WorkhorseBackend.ASYNCIO).retry(retries=1)
+        for _ in range(3):
+            wh.add_runnable(FlakyWorkload(directory=self.directory, attempts=2))
+        self.assertEqual([0, 1, 2], wh.join())
+
+    def test_timeout(self):
+        wh: Workhorse = Workhorse(threads=2).retry(retries=0, timeout=0.5)
+        for seconds in [0.01, 30, 0.01, 0.01]:
+            wh.add_runnable(SlowWorkload(seconds))
+        start: float = time.perf_counter()
+        self.assertEqual([0.01, None, 0.01, 0.01], wh.join())
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertIn("timed out", wh.failures[1])
+
+    def test_timeout_threads(self):
+        wh: Workhorse = Workhorse(threads=2, backend=WorkhorseBackend.THREAD).retry(retries=0, timeout=0.3)
+        workloads: List[Workload] = [SlowWorkload(seconds) for seconds in [0.01, 2, 0.01, 0.01]]
+        for w in workloads:
+            wh.add_runnable(w)
+        start: float = time.perf_counter()
+        self.assertEqual([0.01, None, 0.01, 0.01], wh.join())
+        self.assertLess(time.perf_counter() - start, 1.5)
+        self.assertIn("timed out", wh.failures[1])
+        # the abandoned thread finishes meanwhile, it must not change the parent's workload
+        time.sleep(2)
+        self.assertIsNone(workloads[1].result)
+        self.assertEqual([0.01, None, 0.01, 0.01], [w.get_result() for w in workloads])
+
+    def test_broken_pool(self):
+        wh: Workhorse = Workhorse(threads=2).retry(retries=2)
+        wh.add_runnable(CrashingWorkload())
+        for _ in range(3):
+            wh.add_runnable(SlowWorkload(0.01))
+        self.assertEqual([None, 0.01, 0.01, 0.01], wh.join())
+        self.assertEqual([0], list(wh.failures.keys()))
+
+    def test_dependencies(self):
+        wh: Workhorse = Workhorse(threads=2)
+        a = SumWorkload(1)
+        b = SumWorkload(10)
+        c = SumWorkload(100)
+        d = SumWorkload(1000)
+        # d is added first, its dependencies are declared later on
+        wh.add_runnable(d)
+        wh.add_runnable(a)
+        wh.add_runnable(b, depends_on=[a])
+        wh.add_runnable(c, depends_on=[a])
+        wh.add_dependency(d, b)
+        wh.add_dependency(d, c)
+        self.assertEqual([1112, 1, 11, 101], wh.join())
+        self.assertEqual(3, len(wh.dag_report.critical_path))
+        self.assertEqual(a.index, wh.dag_report.critical_path[0])
+        self.assertEqual(d.index, wh.dag_report.critical_path[-1])
+
+    def test_dependencies_no_barrier(self):
+        # a slow independent workload must not hold back the chain
+        wh: Workhorse = Workhorse(threads=2, backend=WorkhorseBackend.THREAD).batch()
+        wh.add_runnable(SumWorkload(0, seconds=0.35))
+        upstream: Workload = SumWorkload(1, seconds=0.1)
+        wh.add_runnable(upstream)
+        for _ in range(3):
+            w: Workload = SumWorkload(1, seconds=0.1)
+            wh.add_runnable(w, depends_on=[upstream])
+            upstream = w
+        start: float = time.perf_counter()
+        self.assertEqual([0, 1, 2, 3, 4], wh.join())
+        # with a barrier after the first stage this takes 0.35s + 3 * 0.1s
+        self.assertLess(time.perf_counter() - start, 0.6)
+        self.assertEqual([1, 2, 3, 4], wh.dag_report.critical_path)
+        self.assertAlmostEqual(0.4, wh.dag_report.critical_path_seconds, delta=0.05)
+
+    def test_dependencies_no_barrier_asyncio(self):
+        wh: Workhorse = Workhorse(threads=2, backend=WorkhorseBackend.ASYNCIO)
+        wh.add_runnable(AsyncSumWorkload(0, seconds=0.5))
+        upstream: Workload = AsyncSumWorkload(1, seconds=0.1)
+        wh.add_runnable(upstream)
+        for _ in range(3):
+            w: Workload = AsyncSumWorkload(1, seconds=0.1)
+            wh.add_runnable(w, depends_on=[upstream])
+            upstream = w
+        start: float = time.perf_counter()
+        self.assertEqual([0, 1, 2, 3, 4], wh.join())
+        # rounds of gather would take 0.5s + 3 * 0.1s
+        self.assertLess(time.perf_counter() - start, 0.7)
+
+    def test_dependency_cycle(self):
+        wh: Workhorse = Workhorse(threads=1)
+        a = SumWorkload(1)
+        b = SumWorkload(2)
+        wh.add_runnable(SumWorkload(0))
+        wh.add_runnable(a)
+        wh.add_runnable(b, depends_on=[a])
+        wh.add_dependency(a, b)
+        with self.assertRaisesRegex(RuntimeError, r"cycle between workloads \[1, 2\]"):
+            wh.join()
+
+    def test_dependency_not_added(self):
+        wh: Workhorse = Workhorse(threads=1)
+        with self.assertRaises(RuntimeError):
+            wh.add_runnable(SumWorkload(1), depends_on=[SumWorkload(2)])
+        self.assertEqual([], wh.workloads)
+        self.assertEqual({}, wh.dependencies)
+        upstream: Workload = SumWorkload(2)
+        wh.add_runnable(upstream)
+        with self.assertRaises(RuntimeError):
+            wh.add_runnable(SumWorkload(1), depends_on=[upstream, SumWorkload(3)])
+        self.assertEqual([upstream], wh.workloads)
+        self.assertEqual({}, wh.dependencies)
+        self.assertEqual([2], wh.join())
+
+    def test_failed_dependency(self):
+        wh: Workhorse = Workhorse(threads=2)
+        a = SumWorkload(-1)
+        wh.add_runnable(a)
+        b = SumWorkload(1)
+        wh.add_runnable(b, depends_on=[a])
+        wh.add_runnable(SumWorkload(2), depends_on=[b])
+        wh.add_runnable(SumWorkload(3))
+        self.assertEqual([None, None, None, 3], wh.join())
+        self.assertEqual({0, 1, 2}, set(wh.failures.keys()))
+
+    def test_map(self):
+        self.assertEqual([square(i) for i in range(100)], Workhorse(threads=3).map(square, range(100)))
+        self.assertEqual([], Workhorse(threads=3).map(square, []))
+        wh: Workhorse = Workhorse(threads=2).telemetry()
+        self.assertEqual([square(i) for i in range(10)], wh.map(square, range(10), chunk_size=3))
+        self.assertEqual(4, len(wh.report.records))
+        # map() resets, the Workhorse keeps working
+        self.assertEqual([square(i) for i in range(5)], wh.map(square, range(5)))
+        self.assertEqual([], wh.workloads)
+        wh.add_runnable(SlowWorkload(0.01))
+        with self.assertRaisesRegex(RuntimeError, "1 workloads were added before"):
+            wh.map(square, range(5))
+        self.assertEqual([0.01], wh.join())
+
+    def test_map_reduce(self):
+        wh: Workhorse = Workhorse(threads=4).transport(WorkhorseTransport.RESULT).telemetry()
+        self.assertEqual(sum(i * i for i in range(10_000)), wh.map_reduce(square, add, add, range(10_000)))
+        # one partial result per worker instead of one result per item
+        self.assertEqual(4, len(wh.report.records))
+        self.assertEqual(25, Workhorse(threads=8).map_reduce(square, add, add, [5]))
+        self.assertIsNone(Workhorse(threads=2, backend=WorkhorseBackend.INLINE).map_reduce(square, add, add, []))
+
+    def test_map_failure(self):
+        wh: Workhorse = Workhorse(threads=2)
+        with self.assertRaisesRegex(RuntimeError, "1 of 2 chunks failed"):
+            wh.map(fail_on_13, range(20))
+        self.assertEqual(list(range(10)), wh.map(fail_on_13, range(10)))
+
+    def test_telemetry(self):
+        wh: Workhorse = Workhorse(threads=2).telemetry().transport(WorkhorseTransport.RESULT)
+        for seconds in [0.01, 0.01, 0.01, 0.01, 0.01, 0.2]:
+            wh.add_runnable(SlowWorkload(seconds))
+        wh.add_runnable(FlakyWorkload(directory=self.directory, attempts=2))
+        wh.join()
+        report = wh.report
+        self.assertEqual(7, len(report.records))
+        self.assertEqual(2, len(report.utilisation))
+        self.assertNotIn(os.getpid(), {r.pid for r in report.records})
+        self.assertTrue(all(r.input_bytes > 0 and r.output_bytes > 0 for r in report.records))
+        self.assertTrue(all(r.pickle_seconds > 0 for r in report.records))
+        self.assertTrue(all(r.queue_delay() <= r.dispatch_delay() for r in report.records))
+        self.assertAlmostEqual(report.dispatch_share, report.pickle_share + report.queue_share, places=6)
+        self.assertEqual([[5]], [r.indices for r in report.stragglers])
+        self.assertEqual([[6]], [r.indices for r in report.errors])
+        self.assertGreaterEqual(report.p99, 0.2)
+        self.assertLess(report.p50, 0.1)
+        self.assertGreater(report.compute_share, 0)
+
+        report.save_json(Path(self.directory, "report.json"))
+        with open(Path(self.directory, "report.json")) as f:
+            self.assertEqual(7, json.load(f)["summary"]["units"])
+        report.save_chrome_trace(Path(self.directory, "trace.json"))
+        with open(Path(self.directory, "trace.json")) as f:
+            events = json.load(f)["traceEvents"]
+        self.assertEqual(7, len([e for e in events if e.get("cat") == "run"]))
+        self.assertEqual(2, len([e for e in events if e["name"] == "thread_name"]))
+
+    def test_telemetry_batches_on_threads(self):
+        wh: Workhorse = Workhorse(threads=2, backend=WorkhorseBackend.THREAD).batch(2).telemetry()
+        self.run_file_workloads(wh)
+        self.assertEqual([[0, 1], [2, 3], [4]], sorted(r.indices for r in wh.report.records))
+        self.assertEqual({os.getpid()}, {r.pid for r in wh.report.records})
+        self.assertEqual({r.worker() for r in wh.report.records}, set(wh.report.utilisation.keys()))
+        self.assertTrue(all(r.input_bytes is None and r.pickle_seconds == 0 for r in wh.report.records))
+
+    def test_telemetry_utilisation_per_thread(self):
+        wh: Workhorse = Workhorse(threads=2, backend=WorkhorseBackend.THREAD).telemetry()
+        for _ in range(4):
+            wh.add_runnable(SlowWorkload(0.05))
+        wh.join()
+        # both threads of this process are busy nearly all the time, not one worker at 200%
+        self.assertEqual(2, len(wh.report.utilisation))
+        self.assertTrue(all(u <= 1.0 for u in wh.report.utilisation.values()))
+        self.assertTrue(all(worker.startswith(f"{os.getpid()}/") for worker in wh.report.utilisation))
+
+    def test_telemetry_does_not_change_results(self):
+        wh: Workhorse = Workhorse(threads=2, backend=WorkhorseBackend.THREAD).telemetry()
+        wh.add_runnable(LockWorkload())
+        self.assertTrue(hasattr(wh.join()[0], "acquire"))
+        self.assertEqual({}, wh.failures)
+        self.assertIsNone(wh.report.records[0].output_bytes)
+
+        wh = Workhorse(threads=2).telemetry()
+        unpicklable: Workload = SlowWorkload(0.01)
+        unpicklable.lock = threading.Lock()
+        wh.add_runnable(unpicklable)
+        wh.add_runnable(SlowWorkload(0.01))
+        self.assertEqual([None, 0.01], wh.join())
+        self.assertIn("pickle", wh.failures[0])
+        self.assertEqual([None], [r.input_bytes for r in wh.report.records if r.indices == [0]])
+
+    def test_spans(self):
+        self.addCleanup(OSpans.reset)
+        self.addCleanup(OSpans.enable, False)
+        wh: Workhorse = Workhorse(threads=2).spans()
+        for i in range(6):
+            wh.add_runnable(JS3RoundTripWorkload(i))
+        self.assertEqual([i * 100 for i in range(6)], wh.join())
+        tree = OSpans.tree()
+        workload = tree.children["JS3RoundTripWorkload"]
+        self.assertEqual(6, workload.get_start_count())
+        self.assertEqual({"JS3Enc.encode", "JS3Dec.decode"}, set(workload.children))
+        self.assertEqual({"JS3Enc.traverse", "JS3Enc.full", "JS3Enc.dump"},
+                         set(workload.children["JS3Enc.encode"].children))
+        self.assertEqual({"JS3Dec.parse", "JS3Dec.instantiate"}, set(workload.children["JS3Dec.decode"].children))
+        self.assertIn("JS3RoundTripWorkload;JS3Enc.encode;JS3Enc.traverse ", OSpans.collapsed())
+        pids = {event["pid"] for event in OSpans.chrome_trace()["traceEvents"]}
+        self.assertNotIn(os.getpid(), pids)
+
+    def test_js3_transport(self):
+        table: Table = Table()
+        table.rows = [list(range(i, i + 200)) for i in range(40)]
+        expected: List[int] = [sum(table.rows[i % 40]) for i in range(80)]
+        workloads: List[Workload] = [TableWorkload(table, i % 40) for i in range(80)]
+        per_workload: int = sum(len(pickle.dumps(w)) for w in workloads)
+        pickled_batch: int = len(pickle.dumps(AutoBatchWorkload(workloads, WorkhorseTransport.RESULT)))
+        js3_batch: int = len(pickle.dumps(JS3BatchWorkload(workloads)))
+        print(f"80 workloads sharing one table: pickled one by one {per_workload} bytes, "
+              f"pickled as one batch {pickled_batch} bytes, JS3 batch {js3_batch} bytes")
+        self.assertLess(js3_batch * 10, per_workload)
+        for transport in [WorkhorseTransport.FULL, WorkhorseTransport.RESULT, WorkhorseTransport.JS3]:
+            wh: Workhorse = Workhorse(threads=2).batch(batch_size=20).transport(transport).telemetry()
+            for i in range(80):
+                wh.add_runnable(TableWorkload(table, i % 40))
+            start: float = time.perf_counter()
+            self.assertEqual(expected, wh.join())
+            print(f"{transport.value}: {time.perf_counter() - start:.3f}s, {wh.report.input_bytes} bytes sent, "
+                  f"{wh.report.output_bytes} bytes received")
+
+        # JS3 cannot encode bytes, these results come back pickled
+        wh = Workhorse(threads=2).batch(batch_size=5).transport(WorkhorseTransport.JS3)
+        for i in range(10):
+            wh.add_runnable(BytesTableWorkload(table, i))
+        self.assertEqual([bytes([i, i + 1, i + 2]) for i in range(10)], wh.join())
+        self.assertEqual({}, wh.failures)
+
+        wh = Workhorse(threads=2).batch().transport(WorkhorseTransport.JS3)
+        wh.add_runnable(SumWorkload(3))
+        self.assertRaises(RuntimeError, wh.join)
@@ -0,0 +1,125 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from multiprocessing import Process
+from multiprocessing.connection import Client
+from shared.test_workhorse import SlowWorkload, CrashingWorkload, square, add
+from shared.workhorse import Workhorse, WorkhorseTransport, WorkhorseBackend
+from shared.workhorse_remote import WorkerDaemon, Address
+from typing import Dict, List, Tuple
+from unittest import TestCase
+
+AUTHKEY: bytes = b"test_workhorse_remote"
+
+
+class TestWorkhorseRemote(TestCase):
+    def setUp(self):
+        self.daemons: List[Tuple[Process, Address]] = [WorkerDaemon.spawn(AUTHKEY) for _ in range(4)]
+
+    def tearDown(self):
+        for process, _ in self.daemons:
+            process.kill()
+            process.join()
+
+    def remote(self, daemons: int) -> Workhorse:
+        return Workhorse(threads=daemons).remote([address for _, address in self.daemons[:daemons]], AUTHKEY)
+
+    def run_slow(self, wh: Workhorse, n: int, seconds: float) -> float:
+        for _ in range(n):
+            wh.add_runnable(SlowWorkload(seconds))
+        start: float = time.perf_counter()
+        self.assertEqual([seconds] * n, wh.join())
+        return time.perf_counter() - start
+
+    def test_scales_with_daemons(self):
+        one: float = self.run_slow(self.remote(1), 12, 0.05)
+        four: float = self.run_slow(self.remote(4), 12, 0.05)
+        print(f"1 daemon: {one:.3f}s, 4 daemons: {four:.3f}s")
+        self.assertLess(four, one / 2)
+
+    def test_node_loss(self):
+        wh: Workhorse = self.remote(2).transport(WorkhorseTransport.RESULT)
+        threading.Timer(0.15, self.daemons[0][0].kill).start()
+        self.run_slow(wh, 10, 0.1)
+        self.assertEqual({}, wh.failures)
+
+    def test_crashing_workload(self):
+        wh: Workhorse = self.remote(3)
+        for i in range(9):
+            wh.add_runnable(CrashingWorkload() if i == 2 else SlowWorkload(0.01))
+        self.assertEqual([0.01, 0.01, None] + [0.01] * 6, wh.join())
+        self.assertEqual([2], list(wh.failures))
+        self.assertIn("its node died 2 times", wh.failures[2])
+        # it killed the daemon it ran on and the one it ran alone on, not the last one
+        self.assertEqual(1, len(wh.executor.alive))
+        self.assertEqual(1, len([p for p, _ in self.daemons[:3] if p.is_alive()]))
+
+    def test_all_nodes_lost(self):
+        wh: Workhorse = self.remote(1)
+        self.daemons[0][0].kill()
+        self.daemons[0][0].join()
+        wh.add_runnable(SlowWorkload(0.01))
+        self.assertEqual([None], wh.join())
+        self.assertIn("ConnectionError", wh.failures[0])
+
+    def test_wrong_authkey(self):
+        wh: Workhorse = Workhorse(threads=2).remote([address for _, address in self.daemons[:2]], b"wrong")
+        wh.add_runnable(SlowWorkload(0.01))
+        self.assertEqual([None], wh.join())
+        self.assertIn("all nodes are gone", wh.failures[0])
+        self.assertEqual([], wh.executor.alive)
+
+    def test_no_timeout(self):
+        with self.assertRaises(RuntimeError):
+            self.remote(1).retry(timeout=0.5)
+        with self.assertRaises(RuntimeError):
+            Workhorse(threads=1).retry(timeout=0.5).remote([self.daemons[0][1]], AUTHKEY)
+
+    def test_remote_not_called(self):
+        wh: Workhorse = Workhorse(threads=1, backend=WorkhorseBackend.REMOTE)
+        wh.add_runnable(SlowWorkload(0.01))
+        with self.assertRaisesRegex(RuntimeError, "call remote"):
+            wh.join()
+        wh.remote([self.daemons[0][1]], AUTHKEY)
+        self.assertEqual([0.01], wh.join())
+
+    def test_map_reduce(self):
+        self.assertEqual(sum(i * i for i in range(1000)), self.remote(4).map_reduce(square, add, add, range(1000)))
+
+    def test_unknown_class_on_module_daemons(self):
+        # daemons started like in production do not inherit the client's __main__
+        env: Dict[str, str] = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in sys.path if p != "")
+        env["WORKHORSE_AUTHKEY"] = AUTHKEY.decode()
+        addresses: List[Address] = []
+        for _ in range(2):
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                port: int = s.getsockname()[1]
+            daemon = subprocess.Popen([sys.executable, "-m", "shared.workhorse_remote", "--port", str(port)], env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.addCleanup(daemon.wait)
+            self.addCleanup(daemon.kill)
+            addresses.append(("127.0.0.1", port))
+        for address in addresses:
+            for _ in range(100):
+                try:
+                    Client(address, authkey=AUTHKEY).close()
+                    break
+                except (ConnectionRefusedError, OSError):
+                    time.sleep(0.05)
+        main = sys.modules["__main__"]
+        local = type("Local", (SlowWorkload,), {"__module__": "__main__"})
+        setattr(main, "Local", local)
+        self.addCleanup(delattr, main, "Local")
+        wh: Workhorse = Workhorse(threads=2).remote(addresses, AUTHKEY)
+        for i in range(4):
+            wh.add_runnable(local(0.01) if i == 1 else SlowWorkload(0.01))
+        self.assertEqual([0.01, None, 0.01, 0.01], wh.join())
+        self.assertEqual([1], list(wh.failures))
+        self.assertIn("Can't get attribute 'Local'", wh.failures[1])
+        self.assertEqual(2, len(wh.executor.alive))
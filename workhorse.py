@@ -2,27 +2,138 @@ from __future__ import annotations
 
 import sys
 
+import datetime
+import functools
 import math
+import os
+import pickle
+import threading
+import time
 
 import traceback
-from concurrent.futures import ProcessPoolExecutor
+import types
+from collections import deque
+# the executors are imported when created, concurrent.futures.process alone pulls in most of multiprocessing
+from concurrent.futures import Executor, Future, wait, FIRST_COMPLETED
+from enum import Enum
+from pathlib import Path
+from shared.js3 import JS3, JS3Enc
 from shared.lok import Lok
-from typing import List, Any, Optional
+from shared.otimer import OSpans, OSpanCapture
+from shared.workhorse_telemetry import WorkloadRecord, JobReport
+from typing import List, Any, Optional, Dict, Set, Tuple, Deque, Callable, Iterable
+
+
+class WorkhorseTransport(Enum):
+    FULL = "full"
+    RESULT = "result"
+    JS3 = "js3"
+
+
+class WorkhorseBackend(Enum):
+    PROCESS = "process"
+    THREAD = "thread"
+    ASYNCIO = "asyncio"
+    INLINE = "inline"
+    AUTO = "auto"
+    REMOTE = "remote"
+
+
+class InlineExecutor(Executor):
+    """Runs everything serially in the calling thread. Useful for profiling and debugging workloads."""
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        f: Future = Future()
+        try:
+            f.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            f.set_exception(e)
+        return f
+
+
+class WorkloadOutcome:
+    """What a worker sends back for a workload. With WorkhorseTransport.RESULT this is all that travels back."""
+    def __init__(self, index: Optional[int], result: Any, state: Optional[Dict[str, Any]] = None,
+                 error: Optional[str] = None, duration: float = 0.0):
+        self.index: Optional[int] = index
+        self.result: Any = result
+        self.state: Optional[Dict[str, Any]] = state
+        self.error: Optional[str] = error
+        # seconds spent in run_impl
+        self.duration: float = duration
+        # time.time() in the worker around the whole execution, the worker's pid and threading.get_ident()
+        self.started: float = 0.0
+        self.finished: float = 0.0
+        self.pid: int = 0
+        self.thread: int = 0
+        # pickled size of this outcome, only measured with Workhorse.telemetry()
+        self.output_bytes: Optional[int] = None
+        # what the worker recorded in OSpans, only with Workhorse.spans()
+        self.spans: Optional[OSpanCapture] = None
+
+
+class SharedInput:
+    """
+    Handle to a read-only buffer registered once via Workhorse.share(). Only the segment name and size are pickled,
+    workers attach to the segment and get a zero-copy view.
+    """
+    # segments this process created or attached to, keyed by segment name
+    attached: Dict[str, Any] = {}
+
+    def __init__(self, name: str, size: int, digest: Optional[str] = None):
+        self.name: str = name
+        self.size: int = size
+        # sha256 of the content, taken once by Workhorse.share() for cache_key()
+        self.digest: Optional[str] = digest
+
+    def view(self) -> memoryview:
+        shm = SharedInput.attached.get(self.name, None)
+        if shm is None:
+            from multiprocessing import shared_memory
+            shm = shared_memory.SharedMemory(name=self.name)
+            SharedInput.attached[self.name] = shm
+        return shm.buf[:self.size].toreadonly()
+
+    def __len__(self) -> int:
+        return self.size
 
 
 class Workload:
+    # fields that run_impl mutates and that must be sent back to the parent when using WorkhorseTransport.RESULT
+    state_fields: Set[str] = set()
+    # fields that do not influence the result and are left out of cache_key()
+    cache_ignored: Set[str] = set()
+    # bookkeeping fields every workload has, never part of cache_key()
+    NOT_CACHED: Set[str] = {'executed', 'result', 'index', 'lok', 'upstream_results'}
+    # fields JS3Enc leaves out if the workload is a JS3 as well, see WorkhorseTransport.JS3. Decoding recreates lok.
+    ignored: Set[str] = {'lok'}
 
     def __init__(self):
         self.executed: bool = False
         self.result: Any = None
         self.index: Optional[int] = None
+        # results of the workloads this one depends on, in the order they were declared, see Workhorse.add_dependency()
+        self.upstream_results: List[Any] = []
         self.lok: Lok = Lok(name=self.__class__.__qualname__)
 
     def run(self):
         if self.executed:
             return
         self.executed = True
-        self.result = self.run_impl()
+        result: Any = self.run_impl()
+        if isinstance(result, types.CoroutineType):
+            # async def run_impl outside of WorkhorseBackend.ASYNCIO
+            import asyncio
+            result = asyncio.run(result)
+        self.result = result
+
+    async def run_async(self) -> Any:
+        if not self.executed:
+            self.executed = True
+            result: Any = self.run_impl()
+            if isinstance(result, types.CoroutineType):
+                result = await result
+            self.result = result
+        return self.result
 
     def run_impl(self) -> Any:
         raise NotImplementedError
@@ -38,25 +149,405 @@ class Workload:
     def pre_execution(self):
         pass
 
+    def outcome(self) -> WorkloadOutcome:
+        start: float = time.perf_counter()
+        with OSpans.span(self.__class__.__qualname__):
+            result: Any = self.get_result()
+        duration: float = time.perf_counter() - start
+        state: Optional[Dict[str, Any]] = None
+        if len(self.state_fields) > 0:
+            state = {field: getattr(self, field) for field in self.state_fields}
+        return WorkloadOutcome(index=self.index, result=result, state=state, duration=duration)
+
+    def cache_key(self) -> str:
+        """Stable content hash of the class and all fields except NOT_CACHED and cache_ignored."""
+        import hashlib
+        h = hashlib.sha256()
+        ResultCache.digest(self, h, set())
+        return h.hexdigest()
+
+    def apply_outcome(self, outcome: WorkloadOutcome):
+        self.result = outcome.result
+        self.executed = True
+        if outcome.state is not None:
+            for field, value in outcome.state.items():
+                setattr(self, field, value)
+
+
+class ResultCache:
+    """
+    Pickled workload results in a local directory, one file per Workload.cache_key(). Survives between jobs and
+    processes. Once the directory grows beyond max_bytes the least recently used results are evicted.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 1 << 30):
+        self.directory: Path = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def digest(obj: Any, h: Any, visiting: Set[int]):
+        """Feeds a canonical representation of obj into the hash h. Unlike pickle it does not depend on set order."""
+        t: type = type(obj)
+        if obj is None or t in (bool, int, float, str, complex):
+            h.update(f"{t.__name__}:{obj!r};".encode())
+        elif isinstance(obj, (bytes, bytearray, memoryview)):
+            data: bytes = bytes(obj)
+            h.update(f"bytes:{len(data)}:".encode())
+            h.update(data)
+        elif isinstance(obj, SharedInput):
+            # segment names differ between runs, the content does not. It is hashed once, not for every workload.
+            if obj.digest is None:
+                import hashlib
+                obj.digest = hashlib.sha256(obj.view()).hexdigest()
+            h.update(f"shared:{obj.size}:{obj.digest};".encode())
+        elif isinstance(obj, Enum):
+            h.update(f"enum:{t.__module__}.{t.__qualname__}.{obj.name};".encode())
+        elif isinstance(obj, (Path, datetime.date, datetime.time)):
+            h.update(f"{t.__name__}:{obj};".encode())
+        elif isinstance(obj, types.FunctionType):
+            # by name and code, what the function calls through its globals is not part of the key
+            h.update(f"function:{obj.__module__}.{obj.__qualname__}:".encode())
+            ResultCache.digest_code(obj.__code__, h, visiting)
+            ResultCache.digest(obj.__defaults__, h, visiting)
+            ResultCache.digest(obj.__kwdefaults__, h, visiting)
+            for cell in obj.__closure__ or ():
+                try:
+                    ResultCache.digest(cell.cell_contents, h, visiting)
+                except ValueError:
+                    # a cell that is not filled yet
+                    h.update(b"empty cell;")
+        elif isinstance(obj, types.MethodType):
+            h.update(b"method:")
+            ResultCache.digest(obj.__func__, h, visiting)
+            ResultCache.digest(obj.__self__, h, visiting)
+        elif isinstance(obj, types.BuiltinFunctionType):
+            h.update(f"builtin:{getattr(obj, '__module__', None)}.{obj.__qualname__};".encode())
+            if obj.__self__ is not None and not isinstance(obj.__self__, types.ModuleType):
+                # a bound method of a builtin type, like [].append
+                ResultCache.digest(obj.__self__, h, visiting)
+        elif isinstance(obj, (type, types.ModuleType)):
+            h.update(f"{t.__name__}:{getattr(obj, '__module__', '')}.{getattr(obj, '__qualname__', obj.__name__)};"
+                     .encode())
+        elif isinstance(obj, functools.partial):
+            h.update(b"partial:")
+            ResultCache.digest(obj.func, h, visiting)
+            ResultCache.digest(obj.args, h, visiting)
+            ResultCache.digest(obj.keywords, h, visiting)
+        elif id(obj) in visiting:
+            h.update(b"cycle;")
+        elif isinstance(obj, (list, tuple, dict, set, frozenset)) or hasattr(obj, '__dict__'):
+            visiting.add(id(obj))
+            if isinstance(obj, (list, tuple)):
+                h.update(f"{t.__name__}:{len(obj)}[".encode())
+                for e in obj:
+                    ResultCache.digest(e, h, visiting)
+            elif isinstance(obj, dict):
+                h.update(f"dict:{len(obj)}[".encode())
+                for k, v in sorted(((ResultCache.sub_digest(k, visiting), v) for k, v in obj.items()),
+                                   key=lambda kv: kv[0]):
+                    h.update(k.encode())
+                    ResultCache.digest(v, h, visiting)
+            elif isinstance(obj, (set, frozenset)):
+                h.update(f"set:{len(obj)}[".encode())
+                for e in sorted(ResultCache.sub_digest(e, visiting) for e in obj):
+                    h.update(e.encode())
+            else:
+                h.update(f"obj:{t.__module__}.{t.__qualname__}[".encode())
+                ignored: Set[str] = Workload.NOT_CACHED | obj.cache_ignored if isinstance(obj, Workload) else set()
+                for k in sorted(obj.__dict__.keys()):
+                    if k in ignored:
+                        continue
+                    h.update(f"{k}=".encode())
+                    ResultCache.digest(obj.__dict__[k], h, visiting)
+            h.update(b"];")
+            visiting.discard(id(obj))
+        else:
+            h.update(f"pickle:{t.__module__}.{t.__qualname__}:".encode())
+            h.update(pickle.dumps(obj))
+
+    @staticmethod
+    def digest_code(code: types.CodeType, h: Any, visiting: Set[int]):
+        h.update(code.co_code)
+        h.update(f"{code.co_names}{code.co_varnames}".encode())
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                # nested functions and lambdas, the repr of a code object contains its address
+                ResultCache.digest_code(const, h, visiting)
+            else:
+                ResultCache.digest(const, h, visiting)
+
+    @staticmethod
+    def sub_digest(obj: Any, visiting: Set[int]) -> str:
+        import hashlib
+        h = hashlib.sha256()
+        ResultCache.digest(obj, h, visiting)
+        return h.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return Path(self.directory, f"{key}.pkl")
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        p: Path = self.path(key)
+        try:
+            with open(p, 'rb') as f:
+                result: Any = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return False, None
+        # the modification time is what eviction sorts by
+        os.utime(p)
+        self.hits += 1
+        return True, result
+
+    def put(self, key: str, result: Any):
+        p: Path = self.path(key)
+        tmp: Path = Path(self.directory, f"{key}.{os.getpid()}.tmp")
+        with open(tmp, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, p)
+
+    def evict(self):
+        entries: List[Tuple[float, int, Path]] = []
+        total: int = 0
+        for p in self.directory.glob('*.pkl'):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        entries.sort(key=lambda e: e[0])
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+
+
+class DagReport:
+    """How well a job with dependencies was scheduled. The makespan can never be shorter than the critical path."""
+    def __init__(self, critical_path: List[int], critical_path_seconds: float, makespan_seconds: float):
+        # indices of the workloads on the longest chain of dependencies, weighted by their run time
+        self.critical_path: List[int] = critical_path
+        self.critical_path_seconds: float = critical_path_seconds
+        self.makespan_seconds: float = makespan_seconds
+
+    def __str__(self) -> str:
+        share: float = self.critical_path_seconds / self.makespan_seconds if self.makespan_seconds > 0 else 0.0
+        return f"critical path {self.critical_path_seconds:.3f}s over {len(self.critical_path)} workloads, " \
+               f"makespan {self.makespan_seconds:.3f}s ({share:.1%} of the makespan is the critical path)"
+
 
 class AutoBatchWorkload(Workload):
     """used by Workhorse when you enable batching. Just encapsulates actual workloads."""
-    def __init__(self, workloads: List[Workload]):
+    def __init__(self, workloads: List[Workload], transport: WorkhorseTransport = WorkhorseTransport.FULL):
         super().__init__()
         self.workloads: List[Workload] = workloads
+        self.transport: WorkhorseTransport = transport
 
     def run_impl(self) -> Any:
         results: List[Any] = []
         for wl in self.workloads:
             wl: Workload = wl
-            wl.get_result()
-            # each workload must be the result such that it is returned to the parent process properly
-            results.append(wl)
+            outcome: WorkloadOutcome = Workhorse.StaticMethods.static_execute_outcome(wl)
+            if self.transport == WorkhorseTransport.RESULT or outcome.error is not None:
+                # only index, result and declared state travel back, the parent still holds the inputs
+                results.append(outcome)
+            else:
+                # each workload must be the result such that it is returned to the parent process properly
+                results.append(wl)
         return results
 
+    def outcomes(self, result: Any) -> List[Workload | WorkloadOutcome]:
+        """turns what run_impl() returned back into workloads or outcomes, in the parent"""
+        return result
+
+
+class JS3Batch(JS3):
+    """what JS3BatchWorkload encodes"""
+    def __init__(self, workloads: Optional[List[Workload]] = None):
+        self.workloads: List[Workload] = workloads
+
+
+class JS3Outcomes(JS3):
+    """what JS3BatchWorkload sends back, one entry per workload"""
+    def __init__(self):
+        self.indices: List[int] = []
+        self.results: List[Any] = []
+        self.states: List[Optional[Dict[str, Any]]] = []
+        self.errors: List[Optional[str]] = []
+        self.durations: List[float] = []
+
+    def add(self, outcome: WorkloadOutcome) -> JS3Outcomes:
+        self.indices.append(outcome.index)
+        self.results.append(outcome.result)
+        self.states.append(outcome.state)
+        self.errors.append(outcome.error)
+        self.durations.append(outcome.duration)
+        return self
+
+    def outcomes(self) -> List[WorkloadOutcome]:
+        return [WorkloadOutcome(index=index, result=result, state=state, error=error, duration=duration)
+                for index, result, state, error, duration
+                in zip(self.indices, self.results, self.states, self.errors, self.durations)]
+
+
+class JS3BatchWorkload(AutoBatchWorkload):
+    """
+    Used by Workhorse for WorkhorseTransport.JS3. When pickled, the batch is encoded with JS3Enc as a whole, so an
+    object shared by many of its workloads is written once. Outcomes come back the same way, or pickled if JS3
+    cannot encode a result.
+    """
+    def __init__(self, workloads: List[Workload]):
+        super().__init__(workloads=workloads, transport=WorkhorseTransport.JS3)
+        self.encoded: Optional[str] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state: Dict[str, Any] = dict(self.__dict__)
+        state["workloads"] = []
+        state["encoded"] = JS3Enc(JS3Batch(self.workloads)).encode(indent=None)
+        return state
+
+    def run_impl(self) -> Any:
+        if self.encoded is None:
+            # an in-process backend, nothing was encoded
+            return [Workhorse.StaticMethods.static_execute_outcome(wl) for wl in self.workloads]
+        from shared.js3dec import JS3Dec
+        batch: JS3Batch = JS3Dec().source(self.encoded).decode()
+        outcomes: List[WorkloadOutcome] = [Workhorse.StaticMethods.static_execute_outcome(wl)
+                                           for wl in batch.workloads]
+        reply: JS3Outcomes = JS3Outcomes()
+        for outcome in outcomes:
+            reply.add(outcome)
+        try:
+            return JS3Enc(reply).encode(indent=None)
+        except (RuntimeError, TypeError):
+            # some result is nothing JS3 can encode
+            return outcomes
+
+    def outcomes(self, result: Any) -> List[Workload | WorkloadOutcome]:
+        if not isinstance(result, str):
+            return result
+        from shared.js3dec import JS3Dec
+        reply: JS3Outcomes = JS3Dec().source(result).decode()
+        return reply.outcomes()
+
+
+class MapWorkload(Workload):
+    """used by Workhorse.map(). Applies fn to a chunk of items."""
+    def __init__(self, fn: Callable[[Any], Any], items: List[Any]):
+        super().__init__()
+        self.fn: Callable[[Any], Any] = fn
+        self.items: List[Any] = items
+
+    def run_impl(self) -> Any:
+        return [self.fn(item) for item in self.items]
+
+
+class MapCombineWorkload(Workload):
+    """used by Workhorse.map_reduce(). Maps a chunk of items and combines them into a single partial result."""
+    def __init__(self, map_fn: Callable[[Any], Any], combine_fn: Callable[[Any, Any], Any], items: List[Any]):
+        super().__init__()
+        self.map_fn: Callable[[Any], Any] = map_fn
+        self.combine_fn: Callable[[Any, Any], Any] = combine_fn
+        self.items: List[Any] = items
+
+    def run_impl(self) -> Any:
+        partial: Any = self.map_fn(self.items[0])
+        for item in self.items[1:]:
+            partial = self.combine_fn(partial, self.map_fn(item))
+        return partial
+
+
+class Journal:
+    """
+    Append-only file of completed workload results as (index, cache_key, result) records. A Workhorse pointed at the
+    journal of a killed job replays it and only executes what is missing.
+    """
+
+    def __init__(self, path: Path):
+        self.path: Path = Path(path)
+        self.entries: Dict[int, Tuple[str, Any]] = {}
+        self.file: Optional[Any] = None
+        self.lok: Lok = Lok(src=self)
+        self.load()
+
+    def load(self):
+        """
+        Reads all records. Only a record cut off at the end of the file is truncated, one that does not load any
+        more, e.g. because its class was renamed, is skipped and stays in the file.
+        """
+        if not self.path.exists():
+            return
+        size: int = self.path.stat().st_size
+        good: int = 0
+        with open(self.path, 'rb') as f:
+            while good < size:
+                try:
+                    index, key, result = pickle.load(f)
+                except Exception as e:
+                    end: Optional[int] = Journal.record_end(f, good)
+                    if end is not None:
+                        self.lok.err(f"skipped journal record at byte {good}: '{e.__class__.__qualname__}' '{e}'")
+                        f.seek(end)
+                        good = end
+                        continue
+                    if isinstance(e, (EOFError, pickle.UnpicklingError)) and f.tell() >= size:
+                        # the last record was cut off when the job got killed
+                        os.truncate(self.path, good)
+                    else:
+                        self.lok.err(f"cannot read the journal after byte {good}, ignoring the rest: "
+                                     f"'{e.__class__.__qualname__}' '{e}'")
+                    return
+                self.entries[index] = (key, result)
+                good = f.tell()
+
+    @staticmethod
+    def record_end(f: Any, start: int) -> Optional[int]:
+        """end of the pickle starting at start, found without loading it, None if it is incomplete or garbage"""
+        import pickletools
+        f.seek(start)
+        try:
+            for _ in pickletools.genops(f):
+                pass
+        except ValueError:
+            return None
+        return f.tell()
+
+    def get(self, index: int, key: str) -> Tuple[bool, Any]:
+        entry: Optional[Tuple[str, Any]] = self.entries.get(index, None)
+        if entry is None or entry[0] != key:
+            return False, None
+        return True, entry[1]
+
+    def append(self, index: int, key: str, result: Any):
+        if self.file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.file = open(self.path, 'ab')
+        pickle.dump((index, key, result), self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.flush()
+        self.entries[index] = (key, result)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
 
 class Workhorse:
     class StaticMethods:
+        @staticmethod
+        def detached(unit: Workload) -> Workload:
+            """shallow copy of unit and of the workloads of a batch, without going through __getstate__"""
+            detached: Workload = object.__new__(type(unit))
+            detached.__dict__.update(unit.__dict__)
+            if isinstance(unit, AutoBatchWorkload):
+                detached.workloads = [Workhorse.StaticMethods.detached(w) for w in unit.workloads]
+            return detached
+
         @staticmethod
         def partition_list(ls: List[Any], n: int, max_size: Optional[int] = None) -> List[List[Any]]:
             """
@@ -93,6 +584,59 @@ class Workhorse:
                 print(f"got exception on workload '{e.__class__.__qualname__}' '{e}'", file=sys.stderr)
                 traceback.print_exc()
 
+        @staticmethod
+        def static_execute_outcome(workload: Workload, telemetry: bool = False, spans: bool = False) -> WorkloadOutcome:
+            if spans:
+                OSpans.enable()
+            started: float = time.time()
+            try:
+                outcome: WorkloadOutcome = workload.outcome()
+            except Exception as e:
+                print(f"got exception on workload '{e.__class__.__qualname__}' '{e}'", file=sys.stderr)
+                traceback.print_exc()
+                outcome = WorkloadOutcome(index=workload.index, result=None, error=f"{e.__class__.__qualname__}: {e}",
+                                          duration=time.time() - started)
+            outcome.started = started
+            outcome.finished = time.time()
+            outcome.pid = os.getpid()
+            outcome.thread = threading.get_ident()
+            if spans:
+                outcome.spans = OSpans.take()
+            if telemetry:
+                outcome.output_bytes = Workhorse.StaticMethods.pickled_size(outcome)
+            return outcome
+
+        @staticmethod
+        def pickled_size(obj: Any) -> Optional[int]:
+            """None if obj cannot be pickled, sending it fails on its own and telemetry must not change that"""
+            try:
+                return len(pickle.dumps(obj))
+            except Exception:
+                return None
+
+        @staticmethod
+        async def static_execute_async(workload: Workload, semaphore: Any,
+                                       timeout: Optional[float] = None) -> WorkloadOutcome:
+            import asyncio
+            async with semaphore:
+                started: float = time.time()
+                try:
+                    start: float = time.perf_counter()
+                    result: Any = await asyncio.wait_for(workload.run_async(), timeout)
+                    outcome = WorkloadOutcome(index=workload.index, result=result, duration=time.perf_counter() - start)
+                except asyncio.TimeoutError:
+                    outcome = WorkloadOutcome(index=workload.index, result=None, error=f"timed out after {timeout}s")
+                except Exception as e:
+                    print(f"got exception on workload '{e.__class__.__qualname__}' '{e}'", file=sys.stderr)
+                    traceback.print_exc()
+                    outcome = WorkloadOutcome(index=workload.index, result=None,
+                                              error=f"{e.__class__.__qualname__}: {e}")
+                outcome.started = started
+                outcome.finished = time.time()
+                outcome.pid = os.getpid()
+                outcome.thread = threading.get_ident()
+                return outcome
+
         @staticmethod
         def format_elapsed_time(elapsed_time: float) -> str:
             """
@@ -112,79 +656,670 @@ class Workhorse:
             formatted_time = "{:02}:{:02}:{:02}".format(int(hours), int(minutes), int(seconds))
             return formatted_time
 
-    def __init__(self, threads: int = 4):
+    # AUTO runs the whole job inline if the probe suggests it is done quicker than spawning workers
+    PROBE_INLINE_SECONDS: float = 0.05
+    # AUTO prefers threads if the probe spent less than this share of its wall time on the CPU
+    PROBE_IO_BOUND_CPU_SHARE: float = 0.5
+
+    def __init__(self, threads: int = 4, backend: WorkhorseBackend = WorkhorseBackend.PROCESS):
         self.processes: int = threads
+        self.backend: WorkhorseBackend = backend
         self.workloads: List[Workload] = []
         self.closed: bool = False
         self._batch: bool = False
         self._batch_size: Optional[int] = 0
-        self.executor: ProcessPoolExecutor = ProcessPoolExecutor(max_workers=self.processes)
+        self._transport: WorkhorseTransport = WorkhorseTransport.FULL
+        self._shared: List[Any] = []
+        self._cache: Optional[ResultCache] = None
+        self._journal: Optional[Journal] = None
+        self._retries: int = 0
+        self._timeout: Optional[float] = None
+        self._nodes: List[Tuple[str, int]] = []
+        self._authkey: Optional[bytes] = None
+        self._window: int = 2
+        self._active_backend: WorkhorseBackend = backend
+        self._keys: Dict[int, str] = {}
+        self._attempts: Dict[int, int] = {}
+        self._durations: Dict[int, float] = {}
+        # index -> indices of the workloads it depends on / of the workloads depending on it
+        self.dependencies: Dict[int, List[int]] = {}
+        self.dependents: Dict[int, List[int]] = {}
+        # index -> number of dependencies that have not settled yet
+        self._waiting: Dict[int, int] = {}
+        self.dag_report: Optional[DagReport] = None
+        self._telemetry: bool = False
+        self._spans: bool = False
+        self._records: Dict[Future, WorkloadRecord] = {}
+        self.records: List[WorkloadRecord] = []
+        # telemetry of the last join(), see telemetry()
+        self.report: Optional[JobReport] = None
+        # index -> error of workloads that failed for good during the last join(), their result is None
+        self.failures: Dict[int, str] = {}
+        self.executor: Optional[Executor] = self.create_executor(backend)
         self.lok: Lok = Lok(src=self)
 
+    def create_executor(self, backend: WorkhorseBackend) -> Optional[Executor]:
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        if backend == WorkhorseBackend.PROCESS and Lok.shared:
+            # workers send their lines to the listener of this process, see Lok.start_listener()
+            return ProcessPoolExecutor(max_workers=self.processes, initializer=Lok.attach, initargs=(Lok.records,))
+        if backend == WorkhorseBackend.PROCESS:
+            return ProcessPoolExecutor(max_workers=self.processes)
+        if backend == WorkhorseBackend.THREAD:
+            return ThreadPoolExecutor(max_workers=self.processes)
+        if backend == WorkhorseBackend.INLINE:
+            return InlineExecutor()
+        if backend == WorkhorseBackend.REMOTE and len(self._nodes) > 0:
+            from shared.workhorse_remote import RemoteExecutor
+            return RemoteExecutor(nodes=self._nodes, authkey=self._authkey, window=self._window)
+        # ASYNCIO runs its own event loop, AUTO decides when joining, REMOTE waits for remote()
+        return None
+
+    def remote(self, nodes: List[Tuple[str, int]], authkey: bytes, window: int = 2) -> Workhorse:
+        """
+        Runs the workloads on WorkerDaemons (see workhorse_remote) listening on nodes, one core each. Set threads to
+        the number of nodes, batching goes by it. window is the number of tasks sent ahead to each node. Timeouts are
+        not supported, see retry().
+        """
+        if self._timeout is not None:
+            raise RuntimeError("the remote backend cannot time out workloads, call retry() without timeout")
+        if self.executor is not None:
+            self.executor.shutdown()
+        self._nodes = list(nodes)
+        self._authkey = authkey
+        self._window = window
+        self.backend = WorkhorseBackend.REMOTE
+        self.executor = self.create_executor(self.backend)
+        return self
+
     def batch(self, batch_size: Optional[int] = None) -> Workhorse:
         self._batch = True
         self._batch_size = batch_size
         return self
 
-    def add_runnable(self, workload: Workload):
+    def transport(self, transport: WorkhorseTransport) -> Workhorse:
+        """
+        WorkhorseTransport.FULL pickles whole workloads (inputs and Lok included) back to the parent.
+        WorkhorseTransport.RESULT only sends back index, result and the workload's state_fields and fills them
+        into the workloads the parent already holds.
+        WorkhorseTransport.JS3 sends batches encoded with JS3Enc instead of pickled and gets back what RESULT gets.
+        Objects shared by the workloads of a batch are encoded once. The workloads must subclass Workload and then
+        JS3 (in that order, so Workload.ignored leaves out lok), their classes must be importable by module and name,
+        and their fields and results must be something JS3 handles. Tuples come back as lists.
+        Transports only apply to batches, see batch().
+        """
+        self._transport = transport
+        return self
+
+    def cache(self, directory: Path, max_bytes: int = 1 << 30) -> Workhorse:
+        """Workloads whose cache_key() has a stored result are not executed again, see ResultCache."""
+        self._cache = ResultCache(directory=directory, max_bytes=max_bytes)
+        return self
+
+    def journal(self, path: Path) -> Workhorse:
+        """Appends every completed result to path. Restarting with the same journal skips what is already in there."""
+        self._journal = Journal(path)
+        return self
+
+    def retry(self, retries: int = 1, timeout: Optional[float] = None) -> Workhorse:
+        """
+        Failed workloads are executed up to retries more times, each on its own. A workload running longer than
+        timeout seconds counts as failed. The process backend gets restarted to kill it, threads cannot be killed and
+        are abandoned: with a timeout the thread backend runs copies of the workloads, so a late result does not
+        show up, and join() does not wait for them. The interpreter still does at exit. The inline and the remote
+        backend cannot time out at all, a daemon runs the tasks of a connection one after another and a stuck one
+        would hold up the rest, so a timeout with remote() is rejected.
+        """
+        if timeout is not None and self.backend == WorkhorseBackend.REMOTE:
+            raise RuntimeError("the remote backend cannot time out workloads, call retry() without timeout")
+        self._retries = retries
+        self._timeout = timeout
+        return self
+
+    def telemetry(self, enabled: bool = True) -> Workhorse:
+        """
+        Records submit time, pickling time, start and end in the worker, worker pid and thread, pickled input and
+        output size and errors of every submitted unit. join() aggregates them into report, a JobReport. Measuring the
+        sizes costs an extra pickle of everything that is sent.
+        """
+        self._telemetry = enabled
+        return self
+
+    def spans(self, enabled: bool = True) -> Workhorse:
+        """
+        Turns on OSpans here and in the workers. Every workload runs in a span named after its class, the span trees
+        of the workers come back with their outcomes and are merged into OSpans of this process.
+        """
+        self._spans = enabled
+        OSpans.enable(enabled)
+        return self
+
+    def share(self, data: bytes | bytearray | memoryview) -> SharedInput:
+        """
+        Copies data once into a shared memory segment. Hand the returned SharedInput to your workloads instead of the
+        data itself and call SharedInput.view() in run_impl. Segments are released on join() and reset().
+        """
+        import hashlib
+        from multiprocessing import shared_memory
+        src: memoryview = memoryview(data).cast('B')
+        shm = shared_memory.SharedMemory(create=True, size=max(1, src.nbytes))
+        shm.buf[:src.nbytes] = src
+        self._shared.append(shm)
+        SharedInput.attached[shm.name] = shm
+        return SharedInput(name=shm.name, size=src.nbytes, digest=hashlib.sha256(src).hexdigest())
+
+    def release_shared(self):
+        for shm in self._shared:
+            SharedInput.attached.pop(shm.name, None)
+            try:
+                shm.close()
+            except BufferError:
+                # somebody in this process still holds a view, the mapping goes away with it
+                pass
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._shared = []
+
+    def add_runnable(self, workload: Workload, depends_on: Optional[List[Workload]] = None):
+        upstreams: List[Workload] = depends_on or []
+        # nothing is added if one of them is wrong
+        for upstream in upstreams:
+            self.__check_added(upstream)
         workload.index = len(self.workloads)
         self.workloads.append(workload)
+        for upstream in upstreams:
+            self.add_dependency(workload, upstream)
+
+    def __check_added(self, w: Workload):
+        if w.index is None or w.index >= len(self.workloads) or self.workloads[w.index] is not w:
+            raise RuntimeError(f"'{w.__class__.__qualname__}' has not been added to this {type(self).__name__}")
+
+    def add_dependency(self, workload: Workload, upstream: Workload):
+        """
+        workload runs after upstream finished and finds its result in upstream_results. Both must have been added
+        already. Cycles are detected on join().
+        """
+        self.__check_added(workload)
+        self.__check_added(upstream)
+        self.dependencies.setdefault(workload.index, []).append(upstream.index)
+        self.dependents.setdefault(upstream.index, []).append(workload.index)
+
+    def topological_order(self) -> List[int]:
+        """Indices of all workloads such that every workload comes after its dependencies."""
+        waiting: Dict[int, int] = {index: len(upstream) for index, upstream in self.dependencies.items()}
+        ready: Deque[int] = deque(w.index for w in self.workloads if waiting.get(w.index, 0) == 0)
+        order: List[int] = []
+        while len(ready) > 0:
+            index: int = ready.popleft()
+            order.append(index)
+            for dependent in self.dependents.get(index, []):
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) < len(self.workloads):
+            cycle: List[int] = sorted(set(range(len(self.workloads))) - set(order))
+            raise RuntimeError(f"dependency cycle between workloads {cycle}")
+        return order
 
     def join(self) -> List:
         if self.closed:
             raise RuntimeError('pool already closed!')
+        if self.backend == WorkhorseBackend.REMOTE and self.executor is None:
+            raise RuntimeError("the remote backend needs its nodes, call remote() before join()")
         self.closed = True
-        futures = []
-        remaining_work: List[Workload] = [w for w in self.workloads if not w.check_past_execution()]
-        workloads: List[Workload] = self.workloads.copy()
-        if len(remaining_work) > 0:
-            self.lok(
-                f"'{type(self).__name__}' will work on {len(remaining_work)} workloads using {self.processes} processes. Batch is {self._batch}, batch size is {self._batch_size}.")
-            if self._batch:
-                # batch the remaining workloads
-                batched_work: List[List[Workload]] = [[]]
-                if self._batch_size is None:
-                    idx: int = 0
-                    max_idx: int = math.ceil(len(remaining_work) / self.processes) + 1
-                    for w in remaining_work:
-                        batched_work[-1].append(w)
-                        idx += 1
-                        if idx == max_idx:
-                            idx = 0
-                            batched_work.append([])
+        try:
+            return self.__join()
+        finally:
+            # also runs when a worker crashed and took the pool down
+            self.release_shared()
+            if self._journal is not None:
+                self._journal.close()
+
+    def probe(self, queue: Deque[Workload], remaining: int) -> WorkhorseBackend:
+        """Runs the first ready workload inline and picks a backend from how long and how CPU heavy it was."""
+        import inspect
+        w: Workload = queue[0]
+        if inspect.iscoroutinefunction(w.run_impl):
+            return WorkhorseBackend.ASYNCIO
+        queue.popleft()
+        wall_start: float = time.perf_counter()
+        cpu_start: float = time.process_time()
+        self.__settle(w, Workhorse.StaticMethods.static_execute_outcome(w), queue)
+        wall: float = time.perf_counter() - wall_start
+        cpu: float = time.process_time() - cpu_start
+        if wall * remaining < self.PROBE_INLINE_SECONDS:
+            backend = WorkhorseBackend.INLINE
+        elif cpu < wall * self.PROBE_IO_BOUND_CPU_SHARE:
+            backend = WorkhorseBackend.THREAD
+        else:
+            backend = WorkhorseBackend.PROCESS
+        self.lok(f"probe took {wall * 1000:.2f}ms ({cpu * 1000:.2f}ms cpu), using backend '{backend.value}'.")
+        return backend
+
+    def __restore(self, order: List[int]):
+        """Fills results from the journal and the cache into the workloads, see journal() and cache()."""
+        if self._journal is None and self._cache is None:
+            return
+        import hashlib
+        replayed: int = 0
+        hits: int = 0
+        misses: int = 0
+        for index in order:
+            w: Workload = self.workloads[index]
+            key: str = w.cache_key()
+            if index in self.dependencies:
+                # the result also depends on the upstream results, which are only known through their keys
+                key = hashlib.sha256(":".join([key] + [self._keys[i] for i in self.dependencies[index]]).encode()) \
+                    .hexdigest()
+            self._keys[index] = key
+            if w.check_past_execution():
+                continue
+            if self._journal is not None:
+                found, result = self._journal.get(w.index, key)
+                if found:
+                    w.result = result
+                    w.executed = True
+                    replayed += 1
+                    continue
+            if self._cache is not None:
+                hit, result = self._cache.get(key)
+                if hit:
+                    w.result = result
+                    w.executed = True
+                    hits += 1
                 else:
-                    idx: int = 0
-                    for w in remaining_work:
-                        batched_work[-1].append(w)
-                        idx += 1
-                        if idx == self._batch_size:
-                            idx = 0
-                            batched_work.append([])
-                remaining_work = [AutoBatchWorkload(workloads=batch) for batch in batched_work]
+                    misses += 1
+        if self._journal is not None:
+            self.lok(f"journal: {replayed} workloads already done in '{self._journal.path}'.")
+        if hits + misses > 0:
+            self.lok(f"cache: {hits} hits, {misses} misses, hit rate {hits / (hits + misses):.1%}.")
+
+    def __batches(self, remaining_work: List[Workload]) -> List[Workload]:
+        batched_work: List[List[Workload]] = [[]]
+        if self._batch_size is None:
+            idx: int = 0
+            max_idx: int = math.ceil(len(remaining_work) / self.processes) + 1
+            for w in remaining_work:
+                batched_work[-1].append(w)
+                idx += 1
+                if idx == max_idx:
+                    idx = 0
+                    batched_work.append([])
+        else:
+            idx: int = 0
             for w in remaining_work:
-                w.pre_execution()
-            # todo serialise lib objects
+                batched_work[-1].append(w)
+                idx += 1
+                if idx == self._batch_size:
+                    idx = 0
+                    batched_work.append([])
+        if self._transport == WorkhorseTransport.JS3:
             for w in remaining_work:
-                f = self.executor.submit(Workhorse.StaticMethods.static_execute, workload=w)
-                futures.append(f)
+                if not isinstance(w, JS3) or 'lok' not in w.ignored:
+                    raise RuntimeError(f"WorkhorseTransport.JS3 needs workloads declared like "
+                                       f"'class {type(w).__name__}(Workload, JS3)'")
+            return [JS3BatchWorkload(workloads=batch) for batch in batched_work if batch]
+        return [AutoBatchWorkload(workloads=batch, transport=self._transport) for batch in batched_work if batch]
+
+    def __join(self) -> List:
+        self._keys = {}
+        self._attempts = {}
+        self._durations = {}
+        self.failures = {}
+        self.dag_report = None
+        self.records = []
+        self.report = None
+        order: List[int] = self.topological_order()
+        self.__restore(order)
+        remaining_work: List[Workload] = [w for w in self.workloads if not w.check_past_execution()]
+        workloads: List[Workload] = self.workloads.copy()
+        # workloads whose dependencies are done are ready, the others are queued once their last dependency settles
+        queue: Deque[Workload] = deque()
+        self._waiting = {}
+        for w in remaining_work:
+            waiting: int = sum(1 for i in self.dependencies.get(w.index, []) if not self.workloads[i].executed)
+            if waiting > 0:
+                self._waiting[w.index] = waiting
+            else:
+                self.__ready(w, queue)
+        backend: WorkhorseBackend = self.backend
+        start: float = time.perf_counter()
+        if len(remaining_work) > 0 and backend == WorkhorseBackend.AUTO:
+            backend = self.probe(queue, len(remaining_work))
+            self.executor = self.create_executor(backend)
+        self._active_backend = backend
+        if len(remaining_work) > 0 and backend == WorkhorseBackend.ASYNCIO:
+            self.lok(f"'{type(self).__name__}' will work on {len(remaining_work)} workloads "
+                     f"with at most {self.processes} running concurrently on asyncio.")
+            self.__run_asyncio(queue)
+        elif len(remaining_work) > 0:
+            self.lok(
+                f"'{type(self).__name__}' will work on {len(remaining_work)} workloads using {self.processes} {backend.value} workers. Batch is {self._batch}, batch size is {self._batch_size}, transport is {self._transport.value}.")
+            units: List[Workload] = list(queue)
+            if self._batch and len(self.dependencies) > 0:
+                self.lok("batching is off, workloads with dependencies are dispatched as soon as they are ready.")
+            elif self._batch:
+                units = self.__batches(units)
+            self.__dispatch(units, workloads)
+        if self._telemetry and len(self.records) > 0:
+            self.report = JobReport(self.records)
+            self.lok(str(self.report))
+        if len(self.dependencies) > 0 and len(remaining_work) > 0:
+            self.dag_report = self.__dag_report(order, time.perf_counter() - start)
+            self.lok(str(self.dag_report))
+        if self.executor is not None:
             self.executor.shutdown()
-            debug = [f.result() for f in futures]
-            for w, fr in zip(remaining_work, debug):
-                w: Workload = w
-                w.result = fr
-                w.executed = True
-            if self._batch:
-                # the results are contained in the AutoBatchWorkloads and must be unwrapped
-                for batch_wl in remaining_work:
-                    batch_wl: AutoBatchWorkload = batch_wl
-                    for w in batch_wl.result:
-                        w: Workload = w
-                        workloads[w.index] = w
+        if self._cache is not None:
+            self._cache.evict()
+        if len(self.failures) > 0:
+            self.lok.err(f"{len(self.failures)} workloads failed, their result is None: "
+                         + ", ".join(f"#{index} {error}" for index, error in sorted(self.failures.items())))
         results = [w.get_result() for w in workloads]
         return results
 
+    def __dispatch(self, units: List[Workload], workloads: List[Workload]):
+        """Submits units (workloads or AutoBatchWorkloads) and handles their outcomes as they arrive."""
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures.process import BrokenProcessPool
+        queue: Deque[Workload] = deque(units)
+        # units that were running when a worker died, they run one at a time until the culprit is found
+        suspects: Deque[Workload] = deque()
+        # future -> (unit, deadline)
+        in_flight: Dict[Future, Tuple[Workload, Optional[float]]] = {}
+        while len(queue) > 0 or len(suspects) > 0 or len(in_flight) > 0:
+            while len(suspects) > 0 and len(in_flight) == 0:
+                self.__submit(suspects.popleft(), in_flight)
+            # with a timeout only as many units as there are workers are submitted so the deadline starts on time
+            while len(suspects) == 0 and len(queue) > 0 \
+                    and (self._timeout is None or len(in_flight) < self.processes):
+                self.__submit(queue.popleft(), in_flight)
+            deadlines: List[float] = [d for _, d in in_flight.values() if d is not None]
+            wait_for: Optional[float] = None if len(deadlines) == 0 else max(0.0, min(deadlines) - time.monotonic())
+            done, _ = wait(in_flight.keys(), timeout=wait_for, return_when=FIRST_COMPLETED)
+            broken: bool = False
+            for f in done:
+                unit, _ = in_flight.pop(f)
+                try:
+                    outcome: WorkloadOutcome = f.result()
+                except BrokenProcessPool:
+                    broken = True
+                    suspects.append(unit)
+                    self.__track(f, None, "BrokenProcessPool")
+                    continue
+                except Exception as e:
+                    outcome = WorkloadOutcome(index=unit.index, result=None, error=f"{e.__class__.__qualname__}: {e}")
+                self.__track(f, outcome, outcome.error)
+                self.__complete(unit, outcome, workloads, queue)
+            now: float = time.monotonic()
+            expired: List[Future] = [f for f, (_, d) in in_flight.items() if d is not None and d <= now]
+            for f in expired:
+                unit, _ = in_flight.pop(f)
+                f.cancel()
+                self.__track(f, None, "timed out")
+                self.__complete(unit, WorkloadOutcome(index=unit.index, result=None,
+                                                      error=f"timed out after {self._timeout}s"), workloads, queue)
+            if broken:
+                # all units of the broken pool fail the same way
+                suspects.extend(unit for unit, _ in in_flight.values())
+                in_flight.clear()
+                if len(suspects) == 1:
+                    # it ran alone, so it is the one killing its worker
+                    unit = suspects.popleft()
+                    self.__complete(unit, WorkloadOutcome(index=unit.index, result=None,
+                                                          error="BrokenProcessPool: its worker process died"),
+                                    workloads, queue)
+            if (broken or len(expired) > 0) and isinstance(self.executor, ProcessPoolExecutor):
+                # the only way to stop a running task is to kill its process, the others get submitted again
+                queue.extendleft(reversed([unit for unit, _ in in_flight.values()]))
+                in_flight.clear()
+                self.__restart_executor()
+            elif len(expired) > 0 and self._active_backend == WorkhorseBackend.THREAD:
+                # the stuck threads run on, their futures are dropped. New units get new threads and join() does not
+                # wait for the old ones, the units still in flight finish on the old executor.
+                self.executor.shutdown(wait=False)
+                self.executor = self.create_executor(self._active_backend)
+
+    def __submit(self, unit: Workload, in_flight: Dict[Future, Tuple[Workload, Optional[float]]]):
+        deadline: Optional[float] = None
+        if self._timeout is not None:
+            size: int = len(unit.workloads) if isinstance(unit, AutoBatchWorkload) else 1
+            deadline = time.monotonic() + self._timeout * size
+        # threads and the inline executor share the objects instead of pickling them
+        pickled: bool = self._active_backend in (WorkhorseBackend.PROCESS, WorkhorseBackend.REMOTE)
+        # in this process the spans are recorded in OSpans directly
+        spans: bool = self._spans and pickled
+        # an abandoned thread must not write into the workloads once they timed out
+        sent: Workload = unit
+        if deadline is not None and self._active_backend == WorkhorseBackend.THREAD:
+            sent = Workhorse.StaticMethods.detached(unit)
+        if not self._telemetry:
+            f: Future = self.executor.submit(Workhorse.StaticMethods.static_execute_outcome, workload=sent, spans=spans)
+        else:
+            batch: List[Workload] = unit.workloads if isinstance(unit, AutoBatchWorkload) else [unit]
+            indices: List[int] = [w.index for w in batch]
+            label: str = type(batch[0]).__qualname__
+            input_bytes: Optional[int] = None
+            pickle_seconds: float = 0.0
+            if pickled:
+                # the executor pickles the unit once more after submit, its cost is taken to be the same
+                start: float = time.perf_counter()
+                input_bytes = Workhorse.StaticMethods.pickled_size(unit)
+                pickle_seconds = time.perf_counter() - start
+            record: WorkloadRecord = WorkloadRecord(indices=indices, label=label, submitted=time.time(),
+                                                    input_bytes=input_bytes)
+            record.pickle_seconds = pickle_seconds
+            # sizes are only measured for what crosses a process
+            f = self.executor.submit(Workhorse.StaticMethods.static_execute_outcome, workload=sent,
+                                     telemetry=pickled, spans=spans)
+            self._records[f] = record
+        in_flight[f] = (unit, deadline)
+
+    def __track(self, f: Future, outcome: Optional[WorkloadOutcome], error: Optional[str]):
+        record: Optional[WorkloadRecord] = self._records.pop(f, None)
+        if record is None:
+            return
+        record.received = time.time()
+        record.error = error
+        if outcome is not None:
+            record.started = outcome.started
+            record.finished = outcome.finished
+            record.pid = outcome.pid
+            record.thread = outcome.thread
+            record.output_bytes = outcome.output_bytes
+        else:
+            # the worker never reported back, all we know is that it ended now
+            record.started = record.finished = record.received
+        self.records.append(record)
+
+    def __restart_executor(self):
+        old: Executor = self.executor
+        processes: Dict[int, Any] = getattr(old, '_processes', None) or {}
+        for p in list(processes.values()):
+            p.terminate()
+        old.shutdown(wait=False, cancel_futures=True)
+        self.executor = self.create_executor(self._active_backend)
+
+    def __complete(self, unit: Workload, outcome: WorkloadOutcome, workloads: List[Workload], queue: Deque[Workload]):
+        if outcome.spans is not None:
+            OSpans.merge(outcome.spans)
+        if not isinstance(unit, AutoBatchWorkload):
+            self.__settle(unit, outcome, queue)
+        elif outcome.error is not None:
+            # the batch as a whole died or timed out, its workloads are retried on their own
+            for w in unit.workloads:
+                self.__settle(w, WorkloadOutcome(index=w.index, result=None, error=outcome.error), queue)
+        else:
+            # the results are contained in the AutoBatchWorkloads and must be unwrapped
+            for r in unit.outcomes(outcome.result):
+                if isinstance(r, WorkloadOutcome):
+                    self.__settle(workloads[r.index], r, queue)
+                else:
+                    w: Workload = r
+                    workloads[w.index] = w
+                    self.__settle(w, None, queue)
+
+    def __settle(self, w: Workload, outcome: Optional[WorkloadOutcome], queue: Deque[Workload]):
+        """Applies the outcome of a single workload or queues it again if it failed and has retries left."""
+        if outcome is not None and outcome.error is not None:
+            attempt: int = self._attempts.get(w.index, 0) + 1
+            self._attempts[w.index] = attempt
+            if attempt <= self._retries:
+                self.lok(f"workload #{w.index} failed ({outcome.error}), retry {attempt}/{self._retries}.")
+                # in-process backends ran the parent's own object
+                w.executed = False
+                queue.append(w)
+                return
+            self.failures[w.index] = outcome.error
+        if outcome is not None:
+            w.apply_outcome(outcome)
+            self._durations[w.index] = outcome.duration
+        if outcome is None or outcome.error is None:
+            self.__record(w)
+        self.__release_dependents(w, queue)
+
+    def __ready(self, w: Workload, queue: Deque[Workload]):
+        if w.index in self.dependencies:
+            w.upstream_results = [self.workloads[i].result for i in self.dependencies[w.index]]
+        w.pre_execution()
+        queue.append(w)
+
+    def __release_dependents(self, w: Workload, queue: Deque[Workload]):
+        for index in self.dependents.get(w.index, []):
+            if index not in self._waiting:
+                continue
+            self._waiting[index] -= 1
+            if self._waiting[index] > 0:
+                continue
+            del self._waiting[index]
+            dependent: Workload = self.workloads[index]
+            failed: List[int] = [i for i in self.dependencies[index] if i in self.failures]
+            if len(failed) > 0:
+                # no point in running it, it fails as well and so does everything downstream
+                self.failures[index] = f"upstream workloads {failed} failed"
+                dependent.result = None
+                dependent.executed = True
+                self.__release_dependents(dependent, queue)
+            else:
+                self.__ready(dependent, queue)
+
+    def __dag_report(self, order: List[int], makespan: float) -> DagReport:
+        # longest run time of a chain ending in index, and its predecessor on that chain
+        finish: Dict[int, float] = {}
+        previous: Dict[int, Optional[int]] = {}
+        for index in order:
+            upstream: List[int] = self.dependencies.get(index, [])
+            before: Optional[int] = max(upstream, key=lambda i: finish[i]) if len(upstream) > 0 else None
+            previous[index] = before
+            finish[index] = self._durations.get(index, 0.0) + (finish[before] if before is not None else 0.0)
+        end: int = max(finish.keys(), key=lambda i: finish[i])
+        path: List[int] = []
+        current: Optional[int] = end
+        while current is not None:
+            path.append(current)
+            current = previous[current]
+        return DagReport(critical_path=list(reversed(path)), critical_path_seconds=finish[end],
+                         makespan_seconds=makespan)
+
+    def __record(self, w: Workload):
+        key: Optional[str] = self._keys.get(w.index, None)
+        if key is None:
+            return
+        if self._journal is not None:
+            self._journal.append(w.index, key, w.result)
+        if self._cache is not None:
+            self._cache.put(key, w.result)
+
+    def __run_asyncio(self, queue: Deque[Workload]):
+        import asyncio
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(self.processes)
+            # task -> (workload, submitted)
+            tasks: Dict[asyncio.Task, Tuple[Workload, float]] = {}
+            while len(queue) > 0 or len(tasks) > 0:
+                # retries and newly ready dependents start right away, not after the others
+                while len(queue) > 0:
+                    w: Workload = queue.popleft()
+                    task = asyncio.ensure_future(
+                        Workhorse.StaticMethods.static_execute_async(w, semaphore, self._timeout))
+                    tasks[task] = (w, time.time())
+                done, _ = await asyncio.wait(set(tasks), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    w, submitted = tasks.pop(task)
+                    outcome: WorkloadOutcome = task.result()
+                    if self._telemetry:
+                        record: WorkloadRecord = WorkloadRecord(indices=[w.index], label=type(w).__qualname__,
+                                                                submitted=submitted, input_bytes=None)
+                        record.started, record.finished, record.pid = outcome.started, outcome.finished, outcome.pid
+                        record.thread = outcome.thread
+                        record.received = outcome.finished
+                        record.error = outcome.error
+                        self.records.append(record)
+                    self.__settle(w, outcome, queue)
+
+        asyncio.run(run_all())
+
+    def __map_chunks(self, chunks: List[Workload]) -> List[Any]:
+        if len(self.workloads) > 0:
+            raise RuntimeError(f"{len(self.workloads)} workloads were added before, join() them before map()")
+        indices: List[int] = []
+        for chunk in chunks:
+            self.add_runnable(chunk)
+            indices.append(chunk.index)
+        try:
+            results: List[Any] = self.join()
+        finally:
+            # ready for the next map() or add_runnable(), failures stay for the error below
+            failures: Dict[int, str] = self.failures
+            self.reset()
+            self.failures = failures
+        failed: List[int] = [index for index in indices if index in self.failures]
+        if len(failed) > 0:
+            raise RuntimeError(f"{len(failed)} of {len(indices)} chunks failed: "
+                               + ", ".join(self.failures[index] for index in failed))
+        return [results[index] for index in indices]
+
+    def map(self, fn: Callable[[Any], Any], iterable: Iterable[Any], chunk_size: Optional[int] = None) -> List[Any]:
+        """
+        [fn(item) for item in iterable], one workload per chunk of items, see StaticMethods.partition_list().
+        Joins like join() does and resets afterwards, so the Workhorse can be used again. No other workloads may have
+        been added. fn must be picklable for the process backend.
+        """
+        items: List[Any] = list(iterable)
+        chunks: List[List[Any]] = Workhorse.StaticMethods.partition_list(items, self.processes, max_size=chunk_size)
+        mapped: List[List[Any]] = self.__map_chunks([MapWorkload(fn, chunk) for chunk in chunks if len(chunk) > 0])
+        return [result for chunk in mapped for result in chunk]
+
+    def map_reduce(self, map_fn: Callable[[Any], Any], combine_fn: Callable[[Any, Any], Any],
+                   reduce_fn: Callable[[Any, Any], Any], iterable: Iterable[Any],
+                   chunk_size: Optional[int] = None) -> Any:
+        """
+        Each worker maps its chunk of items and folds the results with combine_fn, so only one partial result per
+        chunk travels back. The parent merges the partials pairwise with reduce_fn. Returns None for no items.
+        Joins and resets like map().
+        """
+        items: List[Any] = list(iterable)
+        chunks: List[List[Any]] = Workhorse.StaticMethods.partition_list(items, self.processes, max_size=chunk_size)
+        partials: List[Any] = self.__map_chunks([MapCombineWorkload(map_fn, combine_fn, chunk)
+                                                 for chunk in chunks if len(chunk) > 0])
+        if len(partials) == 0:
+            return None
+        # tree reduction, each level halves the number of partials
+        while len(partials) > 1:
+            reduced: List[Any] = [reduce_fn(partials[i], partials[i + 1]) for i in range(0, len(partials) - 1, 2)]
+            if len(partials) % 2 == 1:
+                reduced.append(partials[-1])
+            partials = reduced
+        return partials[0]
+
     def reset(self) -> Workhorse:
+        self.release_shared()
         self.closed = False
         self.workloads = []
-        self.executor = ProcessPoolExecutor(max_workers=self.processes)
+        self.failures = {}
+        self.dependencies = {}
+        self.dependents = {}
+        self.executor = self.create_executor(self.backend)
         return self
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import sys
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import pickle
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import Executor, Future
+from multiprocessing.connection import Listener, Client, Connection
+from shared.lok import Lok
+from typing import List, Any, Optional, Dict, Tuple, Deque, Callable
+
+Address = Tuple[str, int]
+
+
+class RemoteTask:
+    def __init__(self, task_id: int, fn: Callable, args: Tuple, kwargs: Dict[str, Any], future: Future):
+        self.task_id: int = task_id
+        self.fn: Callable = fn
+        self.args: Tuple = args
+        self.kwargs: Dict[str, Any] = kwargs
+        self.future: Future = future
+        # nodes that died while this task was in flight on them
+        self.lost: int = 0
+
+    def message(self) -> Tuple[int, bytes]:
+        """the task pickled on its own, a daemon that cannot unpickle it still knows which task failed"""
+        return self.task_id, pickle.dumps((self.fn, self.args, self.kwargs))
+
+
+class WorkerDaemon:
+    """
+    Executes whatever a RemoteExecutor sends, one task at a time per connection. Start one daemon per core.
+    Messages are pickled, the authkey handshake of multiprocessing.connection keeps strangers out. Messages are
+    (task_id, pickled task) and (task_id, ok, pickled result or exception), so a task or a result that cannot be
+    unpickled on the other side fails on its own instead of taking the connection down.
+    """
+
+    def __init__(self, address: Address, authkey: bytes):
+        self.address: Address = address
+        self.authkey: bytes = authkey
+        self.lok: Lok = Lok(src=self)
+
+    @staticmethod
+    def spawn(authkey: bytes, host: str = "127.0.0.1", port: int = 0) -> Tuple[multiprocessing.Process, Address]:
+        """Starts a daemon in a new local process and returns it with the address it listens on."""
+        parent, child = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=WorkerDaemon.__serve_spawned, args=((host, port), authkey, child),
+                                          daemon=True)
+        process.start()
+        child.close()
+        address: Address = parent.recv()
+        parent.close()
+        return process, address
+
+    @staticmethod
+    def __serve_spawned(address: Address, authkey: bytes, report: Connection):
+        WorkerDaemon(address, authkey).serve_forever(report=report)
+
+    def serve_forever(self, report: Optional[Connection] = None):
+        with Listener(self.address, authkey=self.authkey) as listener:
+            self.address = listener.address
+            self.lok(f"listening on {self.address[0]}:{self.address[1]}, pid {os.getpid()}.")
+            if report is not None:
+                report.send(self.address)
+                report.close()
+            while True:
+                try:
+                    conn: Connection = listener.accept()
+                except Exception as e:
+                    # a client with the wrong authkey or one that went away during the handshake
+                    self.lok.err(f"rejected connection: '{e.__class__.__qualname__}' '{e}'")
+                    continue
+                threading.Thread(target=self.__serve, args=(conn,), daemon=True).start()
+
+    def __serve(self, conn: Connection):
+        with conn:
+            while True:
+                try:
+                    task_id, task = conn.recv()
+                except (EOFError, OSError):
+                    return
+                ok: bool = False
+                try:
+                    fn, args, kwargs = pickle.loads(task)
+                except Exception as e:
+                    # e.g. a class defined in the client's __main__
+                    self.lok.err(f"cannot unpickle task {task_id}: '{e.__class__.__qualname__}' '{e}'")
+                    value: Any = RuntimeError(f"cannot unpickle the task on {self.address[0]}:{self.address[1]}: "
+                                              f"'{e.__class__.__qualname__}' '{e}'")
+                else:
+                    try:
+                        value = fn(*args, **kwargs)
+                        ok = True
+                    except Exception as e:
+                        traceback.print_exc()
+                        value = e
+                try:
+                    conn.send((task_id, ok, WorkerDaemon.dumps(value)))
+                except (EOFError, OSError):
+                    return
+
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        try:
+            return pickle.dumps(value)
+        except Exception as e:
+            return pickle.dumps(RuntimeError(f"cannot send result: '{e.__class__.__qualname__}' '{e}'"))
+
+
+class RemoteExecutor(Executor):
+    """
+    Sends tasks to WorkerDaemons. Every node gets its own queue, a node that runs dry steals from the back of the
+    longest other queue. If a node goes away its unfinished tasks are handed to the remaining ones. The tasks that
+    were in flight on it are suspects: each runs again alone on a node, and one that loses a second node fails, so a
+    task killing its daemon does not take down all of them.
+    """
+
+    def __init__(self, nodes: List[Address], authkey: bytes, window: int = 2):
+        if len(nodes) == 0:
+            raise RuntimeError("RemoteExecutor needs at least one node")
+        self.nodes: List[Address] = [tuple(node) for node in nodes]
+        self.authkey: bytes = authkey
+        # tasks sent to a node before its first reply arrives, hides the round trip
+        self.window: int = window
+        self.queues: Dict[Address, Deque[RemoteTask]] = {node: deque() for node in self.nodes}
+        # tasks that were in flight on a lost node, see __lose()
+        self.suspects: Deque[RemoteTask] = deque()
+        self.alive: List[Address] = list(self.nodes)
+        self.condition: threading.Condition = threading.Condition()
+        self.closed: bool = False
+        self.ids = itertools.count()
+        self.round_robin = itertools.cycle(self.nodes)
+        self.lok: Lok = Lok(src=self)
+        self.threads: List[threading.Thread] = [threading.Thread(target=self.__run_node, args=(node,), daemon=True)
+                                                for node in self.nodes]
+        for t in self.threads:
+            t.start()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        f: Future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            if len(self.alive) == 0:
+                f.set_exception(ConnectionError("all nodes are gone"))
+                return f
+            node: Address = next(self.round_robin)
+            while node not in self.alive:
+                node = next(self.round_robin)
+            self.queues[node].append(RemoteTask(next(self.ids), fn, args, kwargs, f))
+            self.condition.notify_all()
+        return f
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self.condition:
+            self.closed = True
+            if cancel_futures:
+                for queue in list(self.queues.values()) + [self.suspects]:
+                    for task in queue:
+                        task.future.cancel()
+                    queue.clear()
+            self.condition.notify_all()
+        if wait:
+            for t in self.threads:
+                t.join()
+
+    def __take(self, node: Address) -> Optional[RemoteTask]:
+        """Next task for node, stolen from another node if its own queue is empty. Call with the condition held."""
+        own: Deque[RemoteTask] = self.queues[node]
+        if len(own) > 0:
+            return own.popleft()
+        victim: Deque[RemoteTask] = max(self.queues.values(), key=len)
+        if len(victim) > 0:
+            return victim.pop()
+        return None
+
+    def __idle(self) -> bool:
+        """Call with the condition held."""
+        return len(self.suspects) == 0 and all(len(q) == 0 for q in self.queues.values())
+
+    def __run_node(self, node: Address):
+        in_flight: Dict[int, RemoteTask] = {}
+        conn: Optional[Connection] = None
+        try:
+            conn = Client(node, authkey=self.authkey)
+            while True:
+                to_send: List[RemoteTask] = []
+                with self.condition:
+                    while len(in_flight) == 0 and not self.closed and self.__idle():
+                        self.condition.wait()
+                    if len(in_flight) == 0 and self.closed and self.__idle():
+                        return
+                    while len(in_flight) + len(to_send) < self.window \
+                            and not any(t.lost > 0 for t in list(in_flight.values()) + to_send):
+                        if len(self.suspects) > 0 and len(in_flight) + len(to_send) == 0:
+                            task: Optional[RemoteTask] = self.suspects.popleft()
+                        elif len(self.suspects) > 0:
+                            # a suspect waits for a node with nothing else in flight
+                            break
+                        else:
+                            task = self.__take(node)
+                        if task is None:
+                            break
+                        # tasks of a lost node are running already
+                        if task.future.running() or task.future.set_running_or_notify_cancel():
+                            to_send.append(task)
+                for task in to_send:
+                    try:
+                        conn.send(task.message())
+                    except (EOFError, OSError):
+                        in_flight[task.task_id] = task
+                        raise
+                    except Exception as e:
+                        # the task cannot be pickled
+                        task.future.set_exception(e)
+                        continue
+                    in_flight[task.task_id] = task
+                if len(in_flight) == 0:
+                    continue
+                task_id, ok, pickled = conn.recv()
+                task: RemoteTask = in_flight.pop(task_id)
+                try:
+                    value: Any = pickle.loads(pickled)
+                except Exception as e:
+                    # the node is fine, only this result does not fit here
+                    ok, value = False, e
+                if ok:
+                    task.future.set_result(value)
+                elif isinstance(value, BaseException):
+                    task.future.set_exception(value)
+                else:
+                    task.future.set_exception(RuntimeError(f"task failed: {value}"))
+        except Exception as e:
+            # besides a broken connection e.g. AuthenticationError, nothing may leave the futures of this node hanging
+            self.__lose(node, in_flight, e)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def __lose(self, node: Address, in_flight: Dict[int, RemoteTask], e: Exception):
+        with self.condition:
+            self.alive.remove(node)
+            suspects: List[RemoteTask] = []
+            for task in in_flight.values():
+                task.lost += 1
+                if task.lost > 1:
+                    # it ran alone when this node died too, so it is the one killing its daemon
+                    task.future.set_exception(ConnectionError(f"its node died {task.lost} times, last one "
+                                                              f"{node[0]}:{node[1]}: '{e}'"))
+                else:
+                    suspects.append(task)
+            orphans: List[RemoteTask] = list(self.queues[node])
+            self.queues[node].clear()
+            self.lok.err(f"lost node {node[0]}:{node[1]} ('{e.__class__.__qualname__}' '{e}'), "
+                         f"{len(suspects)} suspects run again alone, {len(orphans)} tasks move to "
+                         f"{len(self.alive)} remaining nodes.")
+            if len(self.alive) == 0:
+                orphans.extend(suspects)
+                orphans.extend(self.suspects)
+                self.suspects.clear()
+                for queue in self.queues.values():
+                    orphans.extend(queue)
+                    queue.clear()
+                for task in orphans:
+                    if not task.future.done():
+                        task.future.set_exception(ConnectionError(f"all nodes are gone, last one: '{e}'"))
+            else:
+                # the tasks were already marked running, they just run again somewhere else
+                self.suspects.extend(suspects)
+                for i, task in enumerate(orphans):
+                    self.queues[self.alive[i % len(self.alive)]].appendleft(task)
+            self.condition.notify_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Workhorse worker daemon, start one per core.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--authkey", default=os.environ.get("WORKHORSE_AUTHKEY", None),
+                        help="shared secret, defaults to $WORKHORSE_AUTHKEY")
+    cli = parser.parse_args()
+    if cli.authkey is None:
+        print("an authkey is required, tasks are pickled", file=sys.stderr)
+        sys.exit(1)
+    WorkerDaemon((cli.host, cli.port), cli.authkey.encode()).serve_forever()
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+from pathlib import Path
+from typing import List, Any, Optional, Dict
+
+
+class WorkloadRecord:
+    """
+    Life of one submitted unit (a workload or a batch of them). Times are time.time() seconds, started and finished
+    are taken in the worker, which is only comparable to the parent's clock on the same machine.
+    """
+
+    def __init__(self, indices: List[int], label: str, submitted: float, input_bytes: Optional[int]):
+        self.indices: List[int] = indices
+        self.label: str = label
+        self.submitted: float = submitted
+        # None if the unit was not pickled, e.g. on the thread backend, or cannot be
+        self.input_bytes: Optional[int] = input_bytes
+        self.started: float = 0.0
+        self.finished: float = 0.0
+        self.received: float = 0.0
+        # seconds the parent spent pickling the unit, included in the time between submitted and started
+        self.pickle_seconds: float = 0.0
+        # the worker process and its thread, threading.get_ident()
+        self.pid: int = 0
+        self.thread: int = 0
+        self.output_bytes: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def runtime(self) -> float:
+        return max(0.0, self.finished - self.started)
+
+    def latency(self) -> float:
+        """submitted until the outcome was back in the parent"""
+        return max(0.0, self.received - self.submitted)
+
+    def worker(self) -> str:
+        """pid/thread, tells apart the threads of one process"""
+        return f"{self.pid}/{self.thread}"
+
+    def dispatch_delay(self) -> float:
+        """pickling the input, sending it and waiting for a free worker"""
+        return max(0.0, self.started - self.submitted)
+
+    def queue_delay(self) -> float:
+        """dispatch_delay() without the parent's pickling: sending and waiting for a free worker"""
+        return max(0.0, self.started - self.submitted - self.pickle_seconds)
+
+    def return_delay(self) -> float:
+        """pickling the outcome and sending it back"""
+        return max(0.0, self.received - self.finished)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class JobReport:
+    """Aggregates the WorkloadRecords of one Workhorse.join()."""
+    # a unit running longer than this many times the median is a straggler
+    STRAGGLER_FACTOR: float = 3.0
+
+    def __init__(self, records: List[WorkloadRecord]):
+        self.records: List[WorkloadRecord] = [r for r in records if r.received > 0]
+        self.start: float = min((r.submitted for r in self.records), default=0.0)
+        self.end: float = max((r.received for r in self.records), default=0.0)
+        self.makespan: float = self.end - self.start
+        runtimes: List[float] = sorted(r.runtime() for r in self.records)
+        self.p50: float = JobReport.percentile(runtimes, 50)
+        self.p95: float = JobReport.percentile(runtimes, 95)
+        self.p99: float = JobReport.percentile(runtimes, 99)
+        latency: float = sum(r.latency() for r in self.records)
+        self.compute_share: float = sum(runtimes) / latency if latency > 0 else 0.0
+        self.dispatch_share: float = sum(r.dispatch_delay() for r in self.records) / latency if latency > 0 else 0.0
+        self.pickle_share: float = sum(min(r.pickle_seconds, r.dispatch_delay()) for r in self.records) / latency \
+            if latency > 0 else 0.0
+        self.queue_share: float = sum(r.queue_delay() for r in self.records) / latency if latency > 0 else 0.0
+        self.ipc_return_share: float = sum(r.return_delay() for r in self.records) / latency if latency > 0 else 0.0
+        self.input_bytes: int = sum(r.input_bytes or 0 for r in self.records)
+        self.output_bytes: int = sum(r.output_bytes or 0 for r in self.records)
+        # WorkloadRecord.worker() -> share of the makespan the worker was busy
+        self.utilisation: Dict[str, float] = {}
+        for r in self.records:
+            self.utilisation[r.worker()] = self.utilisation.get(r.worker(), 0.0) + r.runtime()
+        for worker in self.utilisation:
+            self.utilisation[worker] = self.utilisation[worker] / self.makespan if self.makespan > 0 else 0.0
+        self.stragglers: List[WorkloadRecord] = sorted(
+            [r for r in self.records if len(self.records) > 1 and r.runtime() > self.p50 * self.STRAGGLER_FACTOR],
+            key=lambda r: r.runtime(), reverse=True)
+        self.errors: List[WorkloadRecord] = [r for r in self.records if r.error is not None]
+
+    @staticmethod
+    def percentile(ordered: List[float], p: float) -> float:
+        """nearest rank percentile of an ascending list"""
+        if len(ordered) == 0:
+            return 0.0
+        rank: int = max(1, math.ceil(len(ordered) * p / 100))
+        return ordered[rank - 1]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "units": len(self.records),
+            "makespan": self.makespan,
+            "runtime_p50": self.p50,
+            "runtime_p95": self.p95,
+            "runtime_p99": self.p99,
+            "compute_share": self.compute_share,
+            "dispatch_share": self.dispatch_share,
+            "pickle_share": self.pickle_share,
+            "queue_share": self.queue_share,
+            "ipc_return_share": self.ipc_return_share,
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "utilisation": dict(self.utilisation),
+            "stragglers": [r.indices for r in self.stragglers],
+            "errors": {str(r.indices): r.error for r in self.errors},
+        }
+
+    def __str__(self) -> str:
+        workers: str = ", ".join(f"{worker}: {u:.0%}" for worker, u in sorted(self.utilisation.items()))
+        return f"{len(self.records)} units in {self.makespan:.3f}s, runtime p50 {self.p50 * 1000:.1f}ms " \
+               f"p95 {self.p95 * 1000:.1f}ms p99 {self.p99 * 1000:.1f}ms, compute {self.compute_share:.1%} " \
+               f"dispatch {self.dispatch_share:.1%} (pickle {self.pickle_share:.1%} queue {self.queue_share:.1%}) " \
+               f"return {self.ipc_return_share:.1%} of the latency, " \
+               f"{self.input_bytes} bytes in, {self.output_bytes} bytes out, {len(self.stragglers)} stragglers, " \
+               f"{len(self.errors)} errors, utilisation {workers}"
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"summary": self.summary(), "records": [r.to_dict() for r in self.records]}
+
+    def save_json(self, file: Path, indent: Optional[int] = 2):
+        with open(file, "w") as f:
+            json.dump(self.to_json(), f, indent=indent)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Trace event format, load it in chrome://tracing or https://ui.perfetto.dev"""
+        events: List[Dict[str, Any]] = [{"name": "process_name", "ph": "M", "pid": os.getpid(),
+                                         "args": {"name": "Workhorse (parent)"}}]
+        for pid in {r.pid for r in self.records}:
+            if pid != os.getpid():
+                events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"worker {pid}"}})
+        for r in {r.worker(): r for r in self.records}.values():
+            events.append({"name": "thread_name", "ph": "M", "pid": r.pid, "tid": r.thread,
+                           "args": {"name": f"worker {r.worker()}"}})
+        for r in self.records:
+            args: Dict[str, Any] = {"indices": r.indices, "input_bytes": r.input_bytes,
+                                    "output_bytes": r.output_bytes, "error": r.error}
+            events.append({"name": r.label, "cat": "run", "ph": "X", "pid": r.pid, "tid": r.thread,
+                           "ts": (r.started - self.start) * 1e6, "dur": r.runtime() * 1e6, "args": args})
+            # the parent's view, one lane per unit since they overlap, lane 0 is for in-process backends
+            events.append({"name": r.label, "cat": "in flight", "ph": "X", "pid": os.getpid(), "tid": r.indices[0] + 1,
+                           "ts": (r.submitted - self.start) * 1e6, "dur": r.latency() * 1e6, "args": args})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, file: Path):
+        with open(file, "w") as f:
+            json.dump(self.chrome_trace(), f)